@@ -0,0 +1,87 @@
+from pathlib import Path
+
+import typer
+
+from expedia_ranker.data_pipeline.preprocessing.compaction import compact_table
+from expedia_ranker.data_pipeline.preprocessing.data_standardization import (
+    DEFAULT_ROW_GROUP_SIZE,
+)
+from expedia_ranker.data_pipeline.preprocessing.hotel_index import (
+    hotel_index_path,
+    write_hotel_index,
+)
+from expedia_ranker.data_pipeline.preprocessing.manifest import PreprocessManifest
+from expedia_ranker.io.parquet_io import read_parquet_stats
+from expedia_ranker.io.paths import DATA_INTERIM_DIR
+from expedia_ranker.utilities.logging import logger
+
+app = typer.Typer()
+
+
+@app.command("compact")
+def compact_command(
+    table: str = typer.Argument(..., help="Table appended with preprocess --append"),
+    output_dir: Path = typer.Option(
+        DATA_INTERIM_DIR,
+        help="Interim directory holding the table and the manifest",
+    ),
+    row_group_size: int = typer.Option(
+        DEFAULT_ROW_GROUP_SIZE,
+        min=1,
+        help="Rows per Parquet row group",
+    ),
+    query_sorted: bool = typer.Option(
+        False,
+        "--query-sorted",
+        help="Sort each compacted partition by search_id, display_position",
+    ),
+    hotel_index: bool = typer.Option(
+        False,
+        "--hotel-index",
+        help=(
+            "Cluster partitions by hotel_id and build the hotel_id index and "
+            "zone maps (kept up to date once built)"
+        ),
+    ),
+    min_files: int = typer.Option(
+        2,
+        min=2,
+        help="Also consolidate partitions that hold at least this many files",
+    ),
+):
+    """
+    Merge the files staged by `preprocess --append` into the table:
+        - One file per affected partition, in target-sized row groups
+        - Partitions are swapped in by rename, after a journal is written
+        - Manifest entries of merged files are pointed at the table
+        - The table's hotel_id index is rebuilt, if it has one (merged
+          partitions are then clustered by hotel_id)
+    Keeps the number of files to scan flat as daily drops accumulate.
+    """
+    table_dir = output_dir / table
+    if not table_dir.exists():
+        raise typer.BadParameter(f"Table not found: {table_dir}")
+    hotel_index = hotel_index or hotel_index_path(table_dir).exists()
+    if hotel_index and query_sorted:
+        raise typer.BadParameter(
+            "--query-sorted cannot be combined with the hotel_id index, "
+            "which needs partitions clustered by hotel_id"
+        )
+    logger.info(f"Compacting {table_dir.name}")
+
+    merged = compact_table(
+        table_dir, row_group_size, query_sorted, min_files, hotel_sorted=hotel_index
+    )
+
+    if merged:
+        manifest = PreprocessManifest(output_dir)
+        manifest.relocate(merged, table_dir)
+        manifest.save()
+    if hotel_index:
+        write_hotel_index(table_dir)
+
+    stats = read_parquet_stats(table_dir)
+    logger.success(
+        f" {table}: {stats['rows']:,} rows in {stats['row_groups']} row groups "
+        f"({stats['size_mb']:.2f} MB), {len(merged)} staged entries merged"
+    )
@@ -1,11 +1,35 @@
+from concurrent.futures import as_completed
 from pathlib import Path
 
 import polars as pl
 import typer
 
+from expedia_ranker.data_pipeline.preprocessing.compaction import staging_dir
 from expedia_ranker.data_pipeline.preprocessing.data_standardization import (
+    DEFAULT_ROW_GROUP_SIZE,
     standardize_single_file,
 )
+from expedia_ranker.data_pipeline.preprocessing.dictionaries import (
+    enum_schema,
+    save_dictionaries,
+    update_dictionaries,
+)
+from expedia_ranker.data_pipeline.preprocessing.dimensions import (
+    DIMENSIONS,
+    dimension_path,
+    merge_dimension,
+)
+from expedia_ranker.data_pipeline.preprocessing.manifest import (
+    PreprocessManifest,
+    config_fingerprint,
+)
+from expedia_ranker.data_pipeline.preprocessing.partitioning import (
+    DEFAULT_N_BUCKETS,
+    PARTITION_SCHEMES,
+    partition_columns,
+)
+from expedia_ranker.io.ipc_io import IPC_COMPRESSIONS, sync_ipc_mirror
+from expedia_ranker.io.parquet_io import load_dictionaries
 from expedia_ranker.io.path_helpers import (
     get_feature_rename_map_path,
     get_feature_schema_path,
@@ -13,10 +37,112 @@ from expedia_ranker.io.path_helpers import (
 from expedia_ranker.io.paths import DATA_INTERIM_DIR, DATA_RAW_DIR
 from expedia_ranker.io.yaml_io import load_yaml
 from expedia_ranker.utilities.logging import logger
+from expedia_ranker.utilities.workers import polars_process_pool, polars_thread_budget
 
 app = typer.Typer()
 
 
+def _log_summary(results: list[dict]) -> None:
+    """Log a per-file table of rows, size and elapsed time."""
+    if not results:
+        return
+    logger.info(f" {'file':<30} {'rows':>12} {'MB':>10} {'sec':>8}")
+    for r in sorted(results, key=lambda r: r["file"]):
+        logger.info(
+            f" {r['file']:<30} {r['rows']:>12,} "
+            f"{r['size_mb']:>10.2f} {r['seconds']:>8.2f}"
+        )
+
+
+def _validate_options(
+    partition_by: str,
+    dimensions: list[str],
+    ipc_mirror: str,
+    query_sorted: bool,
+    hotel_index: bool,
+    append: str | None,
+) -> None:
+    """Reject unknown or conflicting options before any file is read."""
+    partition_columns(partition_by)  # fail fast on an unknown scheme
+    for name in dimensions:
+        if name not in DIMENSIONS:
+            raise typer.BadParameter(f"Unknown dimension '{name}'")
+    if ipc_mirror != "none" and ipc_mirror not in IPC_COMPRESSIONS:
+        raise typer.BadParameter(f"Unknown IPC compression '{ipc_mirror}'")
+    if hotel_index and query_sorted:
+        raise typer.BadParameter("--hotel-index cannot be combined with --query-sorted")
+    if append and dimensions:
+        raise typer.BadParameter("--dimension cannot be combined with --append")
+
+
+def _files_to_convert(
+    outputs: dict[Path, Path],
+    manifest: PreprocessManifest,
+    config_hash: str,
+    table_dir: Path | None,
+    force: bool,
+) -> list[Path]:
+    """
+    Input files whose output is missing or out of date per the manifest.
+    With --append (`table_dir`), an output no longer in staging has been
+    merged into the table, which then stands for it.
+    """
+
+    def converted_path(file: Path) -> Path:
+        """Where a converted file lives now: staged, or merged into the table."""
+        if table_dir is not None and not outputs[file].exists():
+            return table_dir
+        return outputs[file]
+
+    files = [
+        file
+        for file in outputs
+        if force or not manifest.is_current(file, converted_path(file), config_hash)
+    ]
+    skipped = len(outputs) - len(files)
+    if skipped:
+        logger.info(f" Skipping {skipped} unchanged files (use --force to redo)")
+    return files
+
+
+def _convert_files(
+    files: list[Path],
+    outputs: dict[Path, Path],
+    rename_map: dict,
+    schema: dict,
+    convert_options: dict,
+    workers: int,
+) -> list[dict | None]:
+    """
+    Run `standardize_single_file` on every file, in this process or in up
+    to `workers` processes sharing the cores.
+    """
+    workers = min(workers, len(files)) or 1
+    if workers == 1:
+        return [
+            standardize_single_file(
+                file, outputs[file], rename_map, schema, **convert_options
+            )
+            for file in files
+        ]
+
+    n_threads = polars_thread_budget(workers)
+    logger.info(f" Using {workers} workers x {n_threads} Polars threads")
+    with polars_process_pool(workers) as executor:
+        futures = [
+            executor.submit(
+                standardize_single_file,
+                file,
+                outputs[file],
+                rename_map,
+                schema,
+                **convert_options,
+            )
+            for file in files
+        ]
+        return [f.result() for f in as_completed(futures)]
+
+
 @app.command("preprocess")
 def preprocess_command(
     input_dir: Path = typer.Option(
@@ -29,24 +155,190 @@ def preprocess_command(
         prompt=True,
         help="Output directory for processed .parquet files",
     ),
+    workers: int = typer.Option(
+        1,
+        min=1,
+        help="Number of files to convert in parallel (one process per file)",
+    ),
+    engine: str = typer.Option(
+        "streaming",
+        help="'streaming' (bounded memory) or a collect engine: 'cpu', 'gpu'",
+    ),
+    row_group_size: int = typer.Option(
+        DEFAULT_ROW_GROUP_SIZE,
+        min=1,
+        help="Rows per Parquet row group",
+    ),
+    memory_limit_mb: int = typer.Option(
+        None,
+        min=64,
+        help="Approximate memory ceiling per file conversion, in MB",
+    ),
+    partition_by: str = typer.Option(
+        "none",
+        help=f"Hive partitioning of each output: {', '.join(PARTITION_SCHEMES)}",
+    ),
+    n_buckets: int = typer.Option(
+        DEFAULT_N_BUCKETS,
+        min=1,
+        help="Number of search_id buckets for --partition-by search_bucket",
+    ),
+    query_sorted: bool = typer.Option(
+        False,
+        "--query-sorted",
+        help="Sort by search_id, display_position; align row groups to queries",
+    ),
+    dimensions: list[str] = typer.Option(
+        [],
+        "--dimension",
+        help=f"Split a dimension table off the facts: {', '.join(DIMENSIONS)}",
+    ),
+    pack_competitor_block: bool = typer.Option(
+        False,
+        "--pack-competitors",
+        help="Store the competitor block as bitmasks and an Array column",
+    ),
+    chunk_mb: int = typer.Option(
+        None,
+        min=1,
+        help="Convert in resumable batches of about this many MB of CSV",
+    ),
+    merge_shards: bool = typer.Option(
+        True,
+        "--merge-shards/--keep-shards",
+        help="With --chunk-mb, merge the shards into the final layout",
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile/--no-profile",
+        help=(
+            "Save a per-column data-quality profile next to every output "
+            "(reads each output once more)"
+        ),
+    ),
+    hotel_index: bool = typer.Option(
+        False,
+        "--hotel-index",
+        help=(
+            "Order rows by hotel_id and save a hotel_id -> row group index "
+            "and zone maps per output"
+        ),
+    ),
+    virtual_placeholders: bool = typer.Option(
+        False,
+        "--virtual-placeholders/--materialize-placeholders",
+        help=(
+            "Record constant missing columns in the Parquet footer, not as data "
+            "(only readers using scan_dataset see them)"
+        ),
+    ),
+    ipc_mirror: str = typer.Option(
+        "none",
+        help=(
+            "Keep a memory-mapped Arrow IPC mirror of every output: "
+            f"none, {', '.join(IPC_COMPRESSIONS)}"
+        ),
+    ),
+    append: str = typer.Option(
+        None,
+        "--append",
+        help="Land the files in the staging area of this table (see compact)",
+    ),
+    force: bool = typer.Option(
+        False,
+        "--force",
+        help="Reconvert every file, even if the manifest says it is current",
+    ),
 ):
     """
     Standardize and convert raw Expedia .csv files (Step 1 of the pipeline):
         - Renames columns
         - Casts data types
-        - Adds missing columns
+        - Adds missing columns (or records them in the footer, if virtual)
         - Saves as .parquet
+    Categorical columns are encoded as Enums from dictionaries shared by
+    all files, so their codes match between train and test.
+    Files whose input and configs are unchanged since the last run are
+    skipped (see the manifest in the output directory) unless --force.
+    With --append TABLE, new files are staged under the table and merged
+    into its partitions by the `compact` command.
     """
     logger.info(f"Starting preprocessing: {input_dir.name} to {output_dir.name}")
+    _validate_options(
+        partition_by, dimensions, ipc_mirror, query_sorted, hotel_index, append
+    )
 
-    rename_map = load_yaml(get_feature_rename_map_path())
-    schema_yaml = load_yaml(get_feature_schema_path())
+    config_paths = [get_feature_rename_map_path(), get_feature_schema_path()]
+    rename_map = load_yaml(config_paths[0])
+    schema_yaml = load_yaml(config_paths[1])
     schema = {k: getattr(pl, v) for k, v in schema_yaml.items()}
 
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    for file in input_dir.glob("*.csv"):
-        output_dir = output_dir / f"{file}.parquet"
-        standardize_single_file(file, output_dir, rename_map, schema)
+    convert_options = {
+        "engine": engine,
+        "row_group_size": row_group_size,
+        "memory_limit_mb": memory_limit_mb,
+        "partition_by": partition_by,
+        "n_buckets": n_buckets,
+        "query_sorted": query_sorted,
+        "dimensions": sorted(dimensions),
+        "pack_competitor_block": pack_competitor_block,
+        "chunk_mb": chunk_mb,
+        "merge_shards": merge_shards,
+        "profile": profile,
+        "hotel_index": hotel_index,
+        "virtual_placeholders": virtual_placeholders,
+    }
+    # Partitioned outputs are dataset directories named after the file
+    suffix = ".parquet" if partition_by == "none" else ""
+    if chunk_mb is not None and not merge_shards:
+        suffix = ".shards"  # the shard directory is the output
+
+    manifest = PreprocessManifest(output_dir)
+    config_hash = config_fingerprint(config_paths, convert_options)
+    # Appended files are staged under the table until the next compaction
+    landing_dir = staging_dir(output_dir / append) if append else output_dir
+    landing_dir.mkdir(parents=True, exist_ok=True)
+    outputs = {
+        file: landing_dir / f"{file.stem}{suffix}"
+        for file in sorted(input_dir.glob("*.csv"))
+    }
+
+    table_dir = output_dir / append if append else None
+    files = _files_to_convert(outputs, manifest, config_hash, table_dir, force)
+
+    # --- Global category dictionaries (shared Enum codes across files) ---
+    if files:
+        dictionaries = update_dictionaries(
+            files, rename_map, schema, load_dictionaries(output_dir)
+        )
+        save_dictionaries(dictionaries, output_dir)
+        schema = enum_schema(schema, dictionaries)
+
+    results = _convert_files(
+        files, outputs, rename_map, schema, convert_options, workers
+    )
+
+    succeeded = [r for r in results if r is not None]
+    _log_summary(succeeded)
+
+    for file in (input_dir / r["file"] for r in succeeded):
+        manifest.record(file, outputs[file], config_hash)
+    manifest.save()
+
+    for name in dimensions:
+        merge_dimension(output_dir, name)
+
+    # Mirrors are refreshed by mtime, so unchanged outputs cost one stat()
+    if ipc_mirror != "none" and not append:
+        mirrored = [dimension_path(output_dir, name) for name in dimensions]
+        for path in [*outputs.values(), *mirrored]:
+            if path.exists():
+                sync_ipc_mirror(path, ipc_mirror)
 
-    logger.success("All files processed.")
+    failed = len(results) - len(succeeded)
+    if failed:
+        logger.error(f"{failed} of {len(results)} files failed.")
+    else:
+        logger.success("All files processed.")
@@ -0,0 +1,174 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import polars as pl
+
+from expedia_ranker.data_pipeline.preprocessing.csv_schema import (
+    read_csv_chunk_typed,
+    read_csv_header,
+)
+from expedia_ranker.io.yaml_io import load_yaml, save_yaml
+from expedia_ranker.utilities.logging import logger
+
+CHECKPOINT_NAME = "_checkpoint.yaml"
+
+# Bytes before the committed offset that must be unchanged to resume
+_TAIL_CHECK_BYTES = 64 * 1024
+
+
+def shard_dir_path(output_path: Path) -> Path:
+    """Return the shard directory of an output: `train.parquet` -> `train.shards`."""
+    return output_path.with_suffix(".shards")
+
+
+def shard_path(shard_dir: Path, index: int) -> Path:
+    """Return the path of the numbered shard."""
+    return shard_dir / f"shard-{index:05d}.parquet"
+
+
+def scan_shards(shard_dir: Path, schema: dict[str, pl.DataType]) -> pl.LazyFrame:
+    """
+    Lazily scan the committed shards in order.
+    Shards written before a dictionary grew are cast to the current Enums
+    (dictionaries only append, so existing codes keep their meaning).
+    """
+    enums = {col: dtype for col, dtype in schema.items() if isinstance(dtype, pl.Enum)}
+    scans = []
+    for path in sorted(shard_dir.glob("shard-*.parquet")):
+        lf = pl.scan_parquet(path)
+        present = lf.collect_schema().names()
+        scans.append(lf.cast({c: dt for c, dt in enums.items() if c in present}))
+    return pl.concat(scans)
+
+
+def _options_fingerprint(
+    rename_map: dict[str, str], schema: dict[str, pl.DataType], options: Any
+) -> str:
+    """
+    Hash everything that shapes the shard contents. Enum categories are
+    left out: a grown dictionary must not invalidate committed shards.
+    """
+    dtypes = [(col, dtype.base_type()) for col, dtype in schema.items()]
+    return hashlib.sha256(
+        repr((sorted(rename_map.items()), dtypes, options)).encode()
+    ).hexdigest()
+
+
+def _tail_digest(input_path: Path, offset: int) -> str:
+    """Hash the bytes just before `offset`, to detect a rewritten input."""
+    start = max(0, offset - _TAIL_CHECK_BYTES)
+    with input_path.open("rb") as f:
+        f.seek(start)
+        return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+def _iter_csv_batches(
+    input_path: Path, offset: int, batch_bytes: int
+) -> Iterator[tuple[bytes, bytes, int]]:
+    """
+    Yield (header line, batch bytes, end offset) for fixed-size batches of
+    whole lines, starting at byte `offset` (0 = just after the header).
+    """
+    with input_path.open("rb") as f:
+        header = f.readline()
+        f.seek(max(offset, len(header)))
+        while data := f.read(batch_bytes):
+            data += f.readline()  # finish the last line of the batch
+            yield header, data, f.tell()
+
+
+def _load_checkpoint(shard_dir: Path) -> dict[str, Any] | None:
+    path = shard_dir / CHECKPOINT_NAME
+    return load_yaml(path) if path.exists() else None
+
+
+def _save_checkpoint(checkpoint: dict[str, Any], shard_dir: Path) -> None:
+    """Replace the checkpoint atomically, so a crash never leaves half of it."""
+    tmp_path = shard_dir / f"{CHECKPOINT_NAME}.tmp"
+    save_yaml(checkpoint, tmp_path)
+    os.replace(tmp_path, shard_dir / CHECKPOINT_NAME)
+
+
+def _can_resume(
+    checkpoint: dict[str, Any] | None, input_path: Path, fingerprint: str
+) -> bool:
+    """
+    A checkpoint is resumable if it was written with the same options and
+    the input still holds the committed bytes. Appending to the input is
+    fine: the new tail is picked up by the next run.
+    """
+    if not checkpoint or checkpoint["fingerprint"] != fingerprint:
+        return False
+    if input_path.stat().st_size < checkpoint["offset"]:
+        return False
+    return _tail_digest(input_path, checkpoint["offset"]) == checkpoint["tail_sha256"]
+
+
+def ingest_csv_shards(
+    input_path: Path,
+    shard_dir: Path,
+    rename_map: dict[str, str],
+    schema: dict[str, pl.DataType],
+    batch_mb: int,
+    standardize: Callable[[pl.LazyFrame], pl.LazyFrame],
+    pack_competitor_block: bool = False,
+) -> dict[str, Any]:
+    """
+    Convert a raw CSV into numbered Parquet shards of about `batch_mb` of
+    CSV each, resuming after the last committed batch.
+
+    A shard is written to a temporary file and renamed before the
+    checkpoint (byte offset, next shard number, row count) is advanced, so
+    a crash at any point loses at most the batch in flight. `standardize`
+    is applied to every parsed batch. It cannot be hashed, so the settings
+    that shape its output (`pack_competitor_block`) are passed as well and
+    must match for a checkpoint to be reused.
+
+    Returns the final checkpoint.
+    """
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    fingerprint = _options_fingerprint(
+        rename_map, schema, (batch_mb, pack_competitor_block)
+    )
+    checkpoint = _load_checkpoint(shard_dir)
+
+    if _can_resume(checkpoint, input_path, fingerprint):
+        if checkpoint["offset"]:
+            logger.info(
+                f" Resuming {input_path.name} at byte {checkpoint['offset']:,} "
+                f"(shard {checkpoint['next_shard']})"
+            )
+    else:
+        for stale in shard_dir.glob("shard-*.parquet"):
+            stale.unlink()
+        checkpoint = {
+            "input": input_path.name,
+            "fingerprint": fingerprint,
+            "offset": 0,
+            "tail_sha256": _tail_digest(input_path, 0),
+            "next_shard": 0,
+            "rows": 0,
+        }
+
+    header = read_csv_header(input_path)
+    batch_bytes = int(batch_mb * 1024**2)
+    batches = _iter_csv_batches(input_path, checkpoint["offset"], batch_bytes)
+    for header_line, data, end in batches:
+        df = standardize(
+            read_csv_chunk_typed(header_line + data, header, rename_map, schema)
+        ).collect()
+        path = shard_path(shard_dir, checkpoint["next_shard"])
+        tmp_path = path.with_suffix(".tmp")
+        df.write_parquet(tmp_path)
+        os.replace(tmp_path, path)
+
+        checkpoint["offset"] = end
+        checkpoint["tail_sha256"] = _tail_digest(input_path, end)
+        checkpoint["next_shard"] += 1
+        checkpoint["rows"] += df.height
+        _save_checkpoint(checkpoint, shard_dir)
+
+    _save_checkpoint(checkpoint, shard_dir)
+    return checkpoint
@@ -0,0 +1,165 @@
+import os
+import shutil
+from pathlib import Path
+
+import polars as pl
+
+from expedia_ranker.data_pipeline.preprocessing.hotel_index import sort_by_hotel
+from expedia_ranker.data_pipeline.preprocessing.query_layout import sort_by_query
+from expedia_ranker.data_pipeline.preprocessing.streaming_engine import (
+    new_streaming_engine,
+)
+from expedia_ranker.io.parquet_io import (
+    align_enums,
+    load_dictionaries,
+    scan_dataset,
+)
+from expedia_ranker.io.yaml_io import load_yaml, save_yaml
+from expedia_ranker.utilities.logging import logger
+
+STAGING_DIR = "_staging"
+JOURNAL_NAME = "_compaction.yaml"
+COMPACTED_NAME = "part-0.parquet"
+_PENDING_SUFFIX = ".compacting"
+
+
+def staging_dir(table_dir: Path) -> Path:
+    """Return the staging area of a table (ignored by `scan_dataset`)."""
+    return table_dir / STAGING_DIR
+
+
+def _partition_key(file: Path, root: Path) -> str:
+    """Hive partition of a file, as its directory relative to root ("." = flat)."""
+    return file.parent.relative_to(root).as_posix()
+
+
+def _table_files(table_dir: Path) -> dict[str, list[Path]]:
+    """Committed files of the table, grouped by partition."""
+    files = {}
+    for file in sorted(table_dir.rglob("*.parquet")):
+        key = _partition_key(file, table_dir)
+        if not key.split("/")[0].startswith("_"):
+            files.setdefault(key, []).append(file)
+    return files
+
+
+def _staged_files(table_dir: Path) -> dict[str, list[Path]]:
+    """
+    Staged files grouped by partition. Each staged entry is one converted
+    raw file: a flat Parquet file or a hive-partitioned directory. Parquet
+    sidecars next to them (`<name>.hotel_index.parquet`, ...) are not data.
+    """
+    files = {}
+    for entry in sorted(staging_dir(table_dir).glob("*")):
+        if entry.is_dir():
+            for file in sorted(entry.rglob("*.parquet")):
+                files.setdefault(_partition_key(file, entry), []).append(file)
+        elif entry.suffix == ".parquet" and "." not in entry.stem:
+            files.setdefault(".", []).append(entry)
+    return files
+
+
+def _commit(table_dir: Path, key: str, replaced: list[str]) -> None:
+    """
+    Swap one compacted partition in and drop the files it replaced.
+    The merged file is renamed over the first old file, so a partition
+    that held one file (the steady state) changes in a single rename.
+    Idempotent, so an interrupted compaction can simply be re-committed.
+    """
+    partition = table_dir / key
+    pending = partition / (COMPACTED_NAME + _PENDING_SUFFIX)
+    if pending.exists():
+        os.replace(pending, partition / COMPACTED_NAME)
+    for name in replaced:
+        if name != COMPACTED_NAME:
+            (partition / name).unlink(missing_ok=True)
+
+
+def _finish(table_dir: Path, journal: dict) -> None:
+    """Commit every partition of a journal, then drop the merged staging."""
+    for key, replaced in journal["partitions"].items():
+        _commit(table_dir, key, replaced)
+    for name in journal["staged"]:
+        entry = staging_dir(table_dir) / name
+        if entry.is_dir():
+            shutil.rmtree(entry)
+        else:
+            entry.unlink(missing_ok=True)
+    (table_dir / JOURNAL_NAME).unlink(missing_ok=True)
+
+
+def compact_table(
+    table_dir: Path,
+    row_group_size: int,
+    query_sorted: bool = False,
+    min_files: int = 2,
+    hotel_sorted: bool = False,
+) -> set[str]:
+    """
+    Merge staged files into their partitions and consolidate partitions
+    that have grown to `min_files` or more files, writing one file per
+    partition with `row_group_size` row groups.
+
+    Every merged partition is first written next to the data; the set of
+    swaps is then saved in a journal before any file is replaced, so a
+    crash never loses or duplicates rows: the next run re-commits it.
+    Enum columns are aligned to the current dictionaries, and virtual
+    columns are materialized, since merged files may disagree on them.
+    Partitions are sorted by query (`query_sorted`) or clustered by hotel
+    for the hotel_id index (`hotel_sorted`).
+    Run it between appends, not while `preprocess --append` is still
+    writing to staging.
+
+    Returns the staged entry names (relative to the table's parent) that
+    were merged, for the manifest.
+    """
+    journal_path = table_dir / JOURNAL_NAME
+    if journal_path.exists():
+        logger.info(" Finishing an interrupted compaction")
+        _finish(table_dir, load_yaml(journal_path))
+
+    table_files = _table_files(table_dir)
+    staged_files = _staged_files(table_dir)
+    keys = sorted(
+        set(staged_files)
+        | {key for key, files in table_files.items() if len(files) >= min_files}
+    )
+    if not keys:
+        logger.info(f" {table_dir.name}: nothing to compact")
+        return set()
+
+    dictionaries = load_dictionaries(table_dir.parent)
+    # Staged entries (with their sidecars) merged by this run
+    staged = sorted(entry.name for entry in staging_dir(table_dir).glob("*"))
+    journal = {"partitions": {}, "staged": staged}
+    for key in keys:
+        inputs = table_files.get(key, []) + staged_files.get(key, [])
+        lf = pl.concat(
+            [align_enums(scan_dataset(file), dictionaries) for file in inputs],
+            how="diagonal_relaxed",
+        )
+        if query_sorted:
+            lf = sort_by_query(lf)
+        elif hotel_sorted:
+            lf = sort_by_hotel(lf)
+        partition = table_dir / key
+        partition.mkdir(parents=True, exist_ok=True)
+        # The new engine cuts row groups of exactly row_group_size rows,
+        # however small the merged files' row groups are
+        with new_streaming_engine():
+            lf.sink_parquet(
+                partition / (COMPACTED_NAME + _PENDING_SUFFIX),
+                row_group_size=row_group_size,
+            )
+        journal["partitions"][key] = [file.name for file in table_files.get(key, [])]
+        logger.info(
+            f" {table_dir.name}/{key}: {len(inputs)} files -> 1 "
+            f"({len(staged_files.get(key, []))} staged)"
+        )
+
+    save_yaml(journal, journal_path)
+    _finish(table_dir, journal)
+    return {
+        (staging_dir(table_dir) / name).relative_to(table_dir.parent).as_posix()
+        for name in staged
+    }
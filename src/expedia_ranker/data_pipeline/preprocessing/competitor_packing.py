@@ -0,0 +1,82 @@
+import polars as pl
+
+N_COMPETITORS = 8
+
+# Bit i of each mask describes competitor i + 1
+COMPETITOR_MASKS = {
+    "comp_cheaper_mask": ("price_rank", 1),
+    "comp_same_price_mask": ("price_rank", 0),
+    "comp_more_expensive_mask": ("price_rank", -1),
+    "comp_unavailable_mask": ("is_unavailable", 1),
+    "comp_rate_valid_mask": ("price_rank", None),
+    "comp_inv_valid_mask": ("is_unavailable", None),
+}
+COMPETITOR_PCT_DIFF = "comp_price_pct_diff"
+
+
+def competitor_columns() -> list[str]:
+    """Return the per-competitor columns replaced by the packed block."""
+    return [
+        f"comp{i}_{field}"
+        for i in range(1, N_COMPETITORS + 1)
+        for field in ("price_rank", "is_unavailable", "price_pct_diff")
+    ]
+
+
+def _mask_expr(field: str, value: int | None) -> pl.Expr:
+    """Set bit i where competitor i + 1 has `value` (or any value if None)."""
+    bits = []
+    for i in range(N_COMPETITORS):
+        col = pl.col(f"comp{i + 1}_{field}")
+        hit = col.is_not_null() if value is None else col.eq(value).fill_null(False)
+        bits.append(hit.cast(pl.UInt8) * (1 << i))
+    return pl.sum_horizontal(bits).cast(pl.UInt8)
+
+
+def pack_competitors(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Replace the 24 sparse competitor columns with one bitmask per state
+    and a fixed-width Array(Float32, 8) of price differences.
+    The packing is lossless: `unpack_competitors` restores the columns.
+    """
+    return lf.with_columns(
+        *[
+            _mask_expr(field, value).alias(name)
+            for name, (field, value) in COMPETITOR_MASKS.items()
+        ],
+        pl.concat_list(
+            pl.col(f"comp{i}_price_pct_diff").cast(pl.Float32)
+            for i in range(1, N_COMPETITORS + 1)
+        )
+        .list.to_array(N_COMPETITORS)
+        .alias(COMPETITOR_PCT_DIFF),
+    ).drop(competitor_columns())
+
+
+def _bit(mask: str, i: int) -> pl.Expr:
+    """True where bit i of the mask column is set."""
+    return (pl.col(mask) & (1 << i)) > 0
+
+
+def unpack_competitors(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Restore the per-competitor columns from a packed block."""
+    exprs = []
+    for i in range(N_COMPETITORS):
+        n = i + 1
+        exprs += [
+            pl.when(~_bit("comp_rate_valid_mask", i))
+            .then(None)
+            .when(_bit("comp_cheaper_mask", i))
+            .then(1)
+            .when(_bit("comp_same_price_mask", i))
+            .then(0)
+            .otherwise(-1)
+            .cast(pl.Int8)
+            .alias(f"comp{n}_price_rank"),
+            pl.when(_bit("comp_inv_valid_mask", i))
+            .then(_bit("comp_unavailable_mask", i))
+            .cast(pl.Int8)
+            .alias(f"comp{n}_is_unavailable"),
+            pl.col(COMPETITOR_PCT_DIFF).arr.get(i).alias(f"comp{n}_price_pct_diff"),
+        ]
+    return lf.with_columns(exprs).drop(*COMPETITOR_MASKS, COMPETITOR_PCT_DIFF)
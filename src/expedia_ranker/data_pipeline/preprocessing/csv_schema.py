@@ -0,0 +1,104 @@
+import csv
+import io
+from pathlib import Path
+
+import polars as pl
+
+# Raw Expedia timestamps, e.g. "2013-04-04 08:32:15"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+NULL_VALUES = ["NULL"]
+
+
+def read_csv_header(input_path: Path) -> list[str]:
+    """
+    Return the column names of a CSV file, from its first line only.
+    (`pl.read_csv(n_rows=0)` still loads the whole file into memory.)
+    """
+    with open(input_path, newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def compile_scan_schema(
+    header: list[str],
+    rename_map: dict[str, str],
+    schema: dict[str, pl.DataType],
+) -> tuple[dict[str, pl.DataType], list[pl.Expr]]:
+    """
+    Map the (renamed) target schema back onto the raw CSV header.
+
+    Returns the parse dtype of every raw column, for `scan_csv(schema=...)`,
+    and the few finishing expressions for types the CSV parser cannot
+    produce from this data directly:
+    - Datetime is read as text and parsed once with DATETIME_FORMAT
+    - Boolean flags are stored as 0/1, so they are read as UInt8 first
+    - Enum columns are read as text and cast strictly, so a value missing
+      from the dictionary fails loudly instead of being mis-encoded
+
+    Raw columns that are not in the schema are kept as Utf8.
+    """
+    scan_schema = {}
+    finishing_exprs = []
+    for raw_col in header:
+        col = rename_map.get(raw_col, raw_col)
+        dtype = schema.get(col, pl.Utf8)
+        if dtype == pl.Datetime:
+            scan_schema[raw_col] = pl.Utf8
+            finishing_exprs.append(
+                pl.col(col).str.strptime(pl.Datetime, DATETIME_FORMAT, exact=True)
+            )
+        elif isinstance(dtype, pl.Enum):
+            scan_schema[raw_col] = pl.Utf8
+            finishing_exprs.append(pl.col(col).cast(dtype))
+        elif dtype == pl.Boolean:
+            scan_schema[raw_col] = pl.UInt8
+            finishing_exprs.append(pl.col(col).cast(pl.Boolean))
+        else:
+            scan_schema[raw_col] = dtype
+    return scan_schema, finishing_exprs
+
+
+def scan_csv_typed(
+    input_path: Path,
+    rename_map: dict[str, str],
+    schema: dict[str, pl.DataType],
+    low_memory: bool = False,
+) -> pl.LazyFrame:
+    """
+    Scan a raw CSV straight into its schema types, then rename.
+    Values are parsed once into their final dtype: there is no inference
+    pass and no cast chain after the read.
+    """
+    scan_schema, finishing_exprs = compile_scan_schema(
+        read_csv_header(input_path), rename_map, schema
+    )
+    lf = pl.scan_csv(
+        input_path,
+        schema=scan_schema,
+        null_values=NULL_VALUES,
+        low_memory=low_memory,
+    ).rename(rename_map, strict=False)
+    if finishing_exprs:
+        lf = lf.with_columns(finishing_exprs)
+    return lf
+
+
+def read_csv_chunk_typed(
+    data: bytes,
+    header: list[str],
+    rename_map: dict[str, str],
+    schema: dict[str, pl.DataType],
+) -> pl.LazyFrame:
+    """
+    Parse an in-memory CSV chunk (header line included) into its schema
+    types, exactly like `scan_csv_typed` does for a whole file.
+    """
+    scan_schema, finishing_exprs = compile_scan_schema(header, rename_map, schema)
+    lf = (
+        pl.read_csv(io.BytesIO(data), schema=scan_schema, null_values=NULL_VALUES)
+        .lazy()
+        .rename(rename_map, strict=False)
+    )
+    if finishing_exprs:
+        lf = lf.with_columns(finishing_exprs)
+    return lf
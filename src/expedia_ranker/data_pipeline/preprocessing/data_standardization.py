@@ -1,10 +1,105 @@
+import json
+import shutil
 import time
+from functools import partial
 from pathlib import Path
+from typing import Any
 
 import polars as pl
 
+from expedia_ranker.data_pipeline.preprocessing.chunked_ingest import (
+    ingest_csv_shards,
+    scan_shards,
+    shard_dir_path,
+)
+from expedia_ranker.data_pipeline.preprocessing.competitor_packing import (
+    pack_competitors,
+)
+from expedia_ranker.data_pipeline.preprocessing.csv_schema import (
+    read_csv_header,
+    scan_csv_typed,
+)
+from expedia_ranker.data_pipeline.preprocessing.dimensions import (
+    dimension_columns,
+    write_partial_dimension,
+)
+from expedia_ranker.data_pipeline.preprocessing.hotel_index import (
+    hotel_index_path,
+    sort_by_hotel,
+    write_hotel_index,
+    zone_map_path,
+)
+from expedia_ranker.data_pipeline.preprocessing.partitioning import (
+    DEFAULT_N_BUCKETS,
+    partition_columns,
+    partition_exprs,
+)
+from expedia_ranker.data_pipeline.preprocessing.profiling import (
+    ColumnProfiler,
+    profile_path,
+)
+from expedia_ranker.data_pipeline.preprocessing.query_layout import (
+    query_index_path,
+    sort_by_query,
+    write_query_aligned,
+)
+from expedia_ranker.data_pipeline.preprocessing.streaming_engine import (
+    new_streaming_engine,
+)
+from expedia_ranker.io.parquet_io import (
+    VIRTUAL_COLUMNS_KEY,
+    add_parquet_metadata,
+    read_parquet_stats,
+    write_hive_dataset,
+)
 from expedia_ranker.utilities.logging import logger
 
+DEFAULT_ROW_GROUP_SIZE = 500_000
+
+# Approximate bytes per value, for sizing streaming batches
+_DTYPE_BYTES = {
+    pl.Boolean: 1,
+    pl.Int8: 1,
+    pl.UInt8: 1,
+    pl.Int16: 2,
+    pl.UInt16: 2,
+    pl.Int32: 4,
+    pl.UInt32: 4,
+    pl.Float32: 4,
+    pl.Categorical: 4,
+    pl.Enum: 4,
+    pl.Int64: 8,
+    pl.UInt64: 8,
+    pl.Float64: 8,
+    pl.Datetime: 8,
+    pl.Date: 4,
+    pl.Utf8: 16,
+}
+
+
+def _missing_column_default(dtype: pl.DataType) -> Any:
+    """Placeholder value of a schema column the raw file does not have."""
+    if dtype == pl.Categorical:
+        return ""
+    elif isinstance(dtype, pl.Enum):
+        return None
+    elif dtype.__class__ in (
+        pl.Int8,
+        pl.Int16,
+        pl.Int32,
+        pl.UInt8,
+        pl.UInt16,
+        pl.UInt32,
+    ):
+        return 0
+    elif dtype.__class__ in (pl.Float32, pl.Float64):
+        return 0.0
+    elif dtype == pl.Boolean:
+        return False
+    elif dtype == pl.Utf8:
+        return ""
+    return None
+
 
 def _add_missing_columns(
     lf: pl.LazyFrame, schema: dict[str, pl.DataType], renamed_cols: list[str]
@@ -18,26 +113,7 @@ def _add_missing_columns(
         typed_nulls = []
         for col in sorted(missing_cols):
             dtype = schema[col]
-            if dtype == pl.Categorical:
-                default_val = ""
-            elif dtype.__class__ in (
-                pl.Int8,
-                pl.Int16,
-                pl.Int32,
-                pl.UInt8,
-                pl.UInt16,
-                pl.UInt32,
-            ):
-                default_val = 0
-            elif dtype.__class__ in (pl.Float32, pl.Float64):
-                default_val = 0.0
-            elif dtype == pl.Boolean:
-                default_val = False
-            elif dtype == pl.Utf8:
-                default_val = ""
-            else:
-                default_val = None
-
+            default_val = _missing_column_default(dtype)
             if dtype == pl.Categorical:
                 typed_nulls.append(
                     pl.lit(default_val, dtype=pl.Utf8).cast(pl.Categorical).alias(col)
@@ -49,56 +125,379 @@ def _add_missing_columns(
     return lf
 
 
+def _virtual_columns(
+    schema: dict[str, pl.DataType], renamed_cols: list[str]
+) -> dict[str, dict[str, Any]]:
+    """
+    Missing columns that can be left out of the file and recorded in its
+    footer instead (see `parquet_io.with_virtual_columns`). Only dtypes
+    that round-trip by name qualify: Enum and Categorical placeholders
+    are still written.
+    """
+    virtual = {}
+    for col in sorted(set(schema) - set(renamed_cols)):
+        dtype = schema[col]
+        if dtype == pl.Categorical or getattr(pl, str(dtype), None) != dtype:
+            continue
+        virtual[col] = {"dtype": str(dtype), "value": _missing_column_default(dtype)}
+    return virtual
+
+
+def _estimated_row_bytes(schema: dict[str, pl.DataType]) -> int:
+    """Rough in-memory width of one row, used to size streaming batches."""
+    return sum(_DTYPE_BYTES.get(dtype.base_type(), 8) for dtype in schema.values())
+
+
+def _apply_memory_limit(
+    schema: dict[str, pl.DataType], memory_limit_mb: int, row_group_size: int
+) -> tuple[int, int]:
+    """
+    Translate a memory ceiling into a streaming morsel size and a row-group
+    size that fit under it.
+
+    Every Polars thread holds a few morsels in flight (raw CSV text, parsed
+    columns, cast output), and the Parquet sink buffers one row group,
+    so half the budget goes to each.
+    """
+    budget = memory_limit_mb * 1024**2
+    row_bytes = _estimated_row_bytes(schema)
+    chunk_size = max(1_000, budget // 2 // (row_bytes * pl.thread_pool_size() * 4))
+    max_row_group = max(chunk_size, budget // 2 // row_bytes)
+    if row_group_size > max_row_group:
+        logger.warning(
+            f" Row group size {row_group_size:,} exceeds the memory limit, "
+            f"using {max_row_group:,}"
+        )
+        row_group_size = max_row_group
+    return chunk_size, row_group_size
+
+
+def _write_parquet(
+    lf: pl.LazyFrame,
+    output_path: Path,
+    engine: str,
+    row_group_size: int,
+    chunk_size: int | None,
+) -> None:
+    """Write the LazyFrame with the streaming sink or a full collect."""
+    if engine == "streaming":
+        with new_streaming_engine(chunk_size):
+            lf.sink_parquet(output_path, row_group_size=row_group_size)
+    else:
+        df = lf.collect(engine=engine)
+        df.write_parquet(output_path, row_group_size=row_group_size)
+
+
+def _write_output(
+    lf: pl.LazyFrame,
+    output_path: Path,
+    engine: str,
+    row_group_size: int,
+    chunk_size: int | None,
+    partition_by: str,
+    query_sorted: bool,
+    metadata: dict[bytes, bytes] | None = None,
+    hotel_sorted: bool = False,
+) -> None:
+    """
+    Write the standardized LazyFrame in the requested layout:
+    - a flat Parquet file (row groups cut at search_id boundaries and a
+      query index sidecar when `query_sorted`)
+    - a hive-partitioned dataset directory when `partition_by` is set
+      (the LazyFrame must already carry the partition columns)
+    Layouts that post-process the file stream to a temporary flat file first.
+    `metadata` is added to the footer of every written file. Sorted inputs
+    (`query_sorted`, `hotel_sorted`) keep their order within partitions.
+    """
+    if partition_by == "none" and not query_sorted:
+        _write_parquet(lf, output_path, engine, row_group_size, chunk_size)
+        if metadata:
+            add_parquet_metadata(output_path, metadata)
+        return
+
+    flat_path = output_path.with_suffix(".tmp.parquet")
+    _write_parquet(lf, flat_path, engine, row_group_size, chunk_size)
+    if partition_by == "none":
+        write_query_aligned(flat_path, output_path, row_group_size, metadata)
+    else:
+        write_hive_dataset(
+            flat_path,
+            output_path,
+            partition_columns(partition_by),
+            row_group_size,
+            preserve_order=query_sorted or hotel_sorted,
+            metadata=metadata,
+        )
+    flat_path.unlink()
+
+
+def _write_layout(
+    lf: pl.LazyFrame,
+    output_path: Path,
+    engine: str,
+    row_group_size: int,
+    chunk_size: int | None,
+    partition_by: str,
+    query_sorted: bool,
+    hotel_index: bool,
+    metadata: dict[bytes, bytes] | None,
+) -> None:
+    """
+    Order the rows for the requested layout, write them with
+    `_write_output` and add the layout's index sidecars:
+    - `query_sorted`: by search_id, with the query index
+    - `hotel_index`: clustered by hotel_id, with the hotel index and zone
+      maps
+    """
+    if query_sorted:
+        lf = sort_by_query(lf)
+    elif hotel_index:
+        lf = sort_by_hotel(lf)
+    _write_output(
+        lf,
+        output_path,
+        engine,
+        row_group_size,
+        chunk_size,
+        partition_by,
+        query_sorted,
+        metadata,
+        hotel_sorted=hotel_index,
+    )
+    if hotel_index:
+        write_hotel_index(output_path)
+
+
+def _drop_virtual_columns(
+    lf: pl.LazyFrame,
+    input_path: Path,
+    rename_map: dict[str, str],
+    schema: dict[str, pl.DataType],
+) -> tuple[pl.LazyFrame, dict[bytes, bytes] | None]:
+    """
+    Leave the constant placeholders of the columns missing from the raw
+    file out of the LazyFrame, and return the footer metadata recording
+    them (None if there are none).
+    """
+    renamed_cols = [rename_map.get(col, col) for col in read_csv_header(input_path)]
+    virtual = _virtual_columns(schema, renamed_cols)
+    if not virtual:
+        return lf, None
+    logger.info(f" Recording virtual columns: {sorted(virtual)}")
+    spec = {"columns": virtual, "order": lf.collect_schema().names()}
+    return lf.drop(*virtual), {VIRTUAL_COLUMNS_KEY: json.dumps(spec).encode()}
+
+
+def _split_dimensions(
+    staged_path: Path, output_path: Path, input_path: Path, dimensions: list[str]
+) -> pl.LazyFrame:
+    """
+    Write the partial dimension tables of a staged file next to the output
+    and return the facts, which keep only the dimension keys.
+    """
+    for name in dimensions:
+        write_partial_dimension(
+            pl.scan_parquet(staged_path), output_path.parent, name, input_path.stem
+        )
+    return pl.scan_parquet(staged_path).drop(dimension_columns(dimensions))
+
+
+def _remove_intermediates(*paths: Path | None) -> None:
+    """Delete the staged files and shard directories of a conversion."""
+    for path in paths:
+        if path is None:
+            continue
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+
+
+def _standardize(
+    lf: pl.LazyFrame, schema: dict[str, pl.DataType], pack_competitor_block: bool
+) -> pl.LazyFrame:
+    """Add missing columns, order them as the schema and pack competitors."""
+    renamed_cols = lf.collect_schema().names()
+    lf = _add_missing_columns(lf, schema, renamed_cols)
+
+    # --- Schema column order, so train and test files concatenate ---
+    extra_cols = [col for col in renamed_cols if col not in schema]
+    lf = lf.select([*schema, *extra_cols])
+    if pack_competitor_block:
+        lf = pack_competitors(lf)
+    return lf
+
+
+def _summarize(input_path: Path, output_path: Path, start_time: float) -> dict:
+    """Log and return the conversion summary, read from the Parquet footers."""
+    elapsed = time.time() - start_time
+    stats = read_parquet_stats(output_path)
+
+    logger.success(
+        f" Saved {stats['rows']:,} rows, {stats['columns']} columns, "
+        f"{stats['row_groups']} row groups ({stats['size_mb']:.2f} MB) "
+        f"to {output_path.name} in {elapsed:.2f} sec"
+    )
+    return {
+        "file": input_path.name,
+        "rows": stats["rows"],
+        "columns": stats["columns"],
+        "size_mb": stats["size_mb"],
+        "seconds": elapsed,
+    }
+
+
+def _remove_sidecars(output_path: Path) -> None:
+    """
+    Delete the layout and profile sidecars of a previous conversion, which
+    would describe the old file once the output is rewritten (e.g. a query
+    index left by --query-sorted on an unsorted file, or zone maps that
+    would prune a reshuffled one).
+    """
+    for path in (
+        query_index_path(output_path),
+        hotel_index_path(output_path),
+        zone_map_path(output_path),
+        profile_path(output_path),
+    ):
+        path.unlink(missing_ok=True)
+
+
 def standardize_single_file(
     input_path: Path,
     output_path: Path,
     rename_map: dict[str, str],
     schema: dict[str, pl.DataType],
-) -> None:
+    engine: str = "streaming",
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    memory_limit_mb: int | None = None,
+    partition_by: str = "none",
+    n_buckets: int = DEFAULT_N_BUCKETS,
+    query_sorted: bool = False,
+    dimensions: list[str] | None = None,
+    pack_competitor_block: bool = False,
+    chunk_mb: int | None = None,
+    merge_shards: bool = True,
+    profile: bool = False,
+    hotel_index: bool = False,
+    virtual_placeholders: bool = False,
+) -> dict | None:
     """
     Standardize a single raw data file:
+    - Parse columns straight into their schema types
     - Rename columns
-    - Cast types
-    - Add typed placeholders for missing columns
-    - Save to Parquet
-    - Log rows, columns, memory, and time
+    - Add typed placeholders for missing columns (or record them as virtual)
+    - Save to Parquet (streamed in batches by default)
+    - Log rows, columns, file size, and time
+
+    `engine` is "streaming" (CPU, bounded memory) or any engine accepted by
+    `LazyFrame.collect` ("cpu", "gpu") to materialize the file first.
+    `memory_limit_mb` caps streaming batch and row-group sizes.
+    With `partition_by` ("month" or "search_bucket"), `output_path` is a
+    hive-partitioned dataset directory instead of a single file.
+    `query_sorted` orders rows by search_id, display_position and, for flat
+    files, aligns row groups to query boundaries.
+    `dimensions` (e.g. ["hotels"]) moves repeated attributes out of the
+    impression facts into per-file partial dimension tables; see
+    `dimensions.merge_dimension` and `dimensions.scan_with_dimensions`.
+    `pack_competitor_block` replaces the 24 competitor columns with
+    bitmasks and one Array column; see `competitor_packing`.
+    `chunk_mb` converts the CSV in batches of about that many MB into
+    numbered shards with a checkpoint, so a failed run resumes after the
+    last committed batch; see `chunked_ingest`. The shards are then merged
+    into the requested layout, or kept as they are if not `merge_shards`.
+    `profile` collects per-column quality stats and saves them as a
+    sidecar; see `profiling.load_profile`. It reads the written output
+    once more, so it is opt-in.
+    `hotel_index` orders rows by hotel_id and saves a hotel_id -> row
+    group index and per-row-group zone maps next to the output; see
+    `hotel_index.read_hotels`. It cannot be combined with `query_sorted`.
+    `virtual_placeholders` leaves constant placeholders for missing columns
+    (e.g. the targets of the test set) out of the file and records them in
+    the Parquet footer; `parquet_io.scan_dataset` adds them back as
+    literals, only when a query selects them. Plain `pl.scan_parquet`
+    readers do not see them, and a flat unsorted output is copied once
+    more to write the footer, so this is opt-in.
+
+    Returns a summary dict (file, rows, columns, size_mb, seconds),
+    or None if the file failed.
     """
     logger.info(f" Processing file: {input_path.resolve().name}")
     start_time = time.time()
 
     try:
-        lf = pl.scan_csv(input_path, null_values=["NULL"], try_parse_dates=True)
-
-        # --- Renaming ---
-        lf = lf.rename(rename_map, strict=False)
-
-        # --- Casting ---
-        renamed_cols = lf.collect_schema().keys()
-        for col, dtype in schema.items():
-            if col in renamed_cols:
-                if dtype == pl.Categorical:
-                    lf = lf.with_columns(pl.col(col).cast(pl.Utf8).cast(pl.Categorical))
-                else:
-                    lf = lf.with_columns(pl.col(col).cast(dtype))
-
-        # --- Missing Columns ---S
-        lf = _add_missing_columns(lf, schema, renamed_cols)
-
-        # --- Collect and Save ---
-        df = lf.collect(engine="gpu")
-        df.write_parquet(output_path)
-        # Print schema for debugging
-
-        # --- Summary Output ---
-        elapsed = time.time() - start_time
-        row_count, col_count = df.shape
-        mem_usage_mb = df.estimated_size("mb")
-
-        logger.success(
-            f" Saved {row_count:,} rows, {col_count} columns "
-            f"({mem_usage_mb:.2f} MB) to {output_path.name} "
-            f"in {elapsed:.2f} sec"
+        _remove_sidecars(output_path)
+        standardize = partial(
+            _standardize, schema=schema, pack_competitor_block=pack_competitor_block
         )
+        shard_dir = None
+        if chunk_mb is None:
+            # --- Typed scan + renaming (single pass, no inference) ---
+            lf = standardize(
+                scan_csv_typed(
+                    input_path,
+                    rename_map,
+                    schema,
+                    low_memory=memory_limit_mb is not None,
+                )
+            )
+        else:
+            # --- Resumable batches into checkpointed shards ---
+            shard_dir = shard_dir_path(output_path)
+            ingest_csv_shards(
+                input_path,
+                shard_dir,
+                rename_map,
+                schema,
+                chunk_mb,
+                standardize,
+                pack_competitor_block=pack_competitor_block,
+            )
+            if not merge_shards:
+                return _summarize(input_path, shard_dir, start_time)
+            lf = scan_shards(shard_dir, schema)
+
+        # --- Constant placeholders move to the footer ---
+        metadata = None
+        if virtual_placeholders:
+            lf, metadata = _drop_virtual_columns(lf, input_path, rename_map, schema)
+
+        chunk_size = None
+        if memory_limit_mb is not None:
+            chunk_size, row_group_size = _apply_memory_limit(
+                schema, memory_limit_mb, row_group_size
+            )
+
+        # --- Partition keys (derived before any column is split off) ---
+        if partition_by != "none":
+            lf = lf.with_columns(partition_exprs(partition_by, n_buckets))
+
+        # --- Dimension tables (facts keep only the keys) ---
+        staged_path = None
+        if dimensions:
+            staged_path = output_path.with_suffix(".staged.parquet")
+            _write_parquet(lf, staged_path, engine, row_group_size, chunk_size)
+            lf = _split_dimensions(staged_path, output_path, input_path, dimensions)
+
+        # --- Write ---
+        _write_layout(
+            lf,
+            output_path,
+            engine,
+            row_group_size,
+            chunk_size,
+            partition_by,
+            query_sorted,
+            hotel_index,
+            metadata,
+        )
+        _remove_intermediates(staged_path, shard_dir)
+        if profile:
+            # A second read of the output, batch by batch
+            ColumnProfiler().update_from_parquet(output_path).save(output_path)
+
+        return _summarize(input_path, output_path, start_time)
 
     except Exception as e:
         logger.error(f" Failed on {input_path.name}: {e}")
+        return None
@@ -0,0 +1,89 @@
+from pathlib import Path
+
+import polars as pl
+
+from expedia_ranker.data_pipeline.preprocessing.csv_schema import (
+    NULL_VALUES,
+    read_csv_header,
+)
+from expedia_ranker.data_pipeline.preprocessing.streaming_engine import (
+    new_streaming_engine,
+)
+from expedia_ranker.io.parquet_io import DICTIONARIES_NAME
+from expedia_ranker.utilities.logging import logger
+
+
+def _sort_key(value: str) -> tuple:
+    """Order numeric IDs by value, anything else after them as text."""
+    return (0, int(value), "") if value.isdigit() else (1, 0, value)
+
+
+def categorical_columns(schema: dict[str, pl.DataType]) -> list[str]:
+    """Return the schema columns typed as Categorical."""
+    return [col for col, dtype in schema.items() if dtype == pl.Categorical]
+
+
+def save_dictionaries(dictionaries: dict[str, list[str]], output_dir: Path) -> None:
+    """Persist the category lists next to the files encoded with them."""
+    pl.DataFrame(
+        {
+            "column": [col for col, cats in dictionaries.items() for _ in cats],
+            "category": [cat for cats in dictionaries.values() for cat in cats],
+        }
+    ).write_parquet(output_dir / DICTIONARIES_NAME)
+
+
+def update_dictionaries(
+    files: list[Path],
+    rename_map: dict[str, str],
+    schema: dict[str, pl.DataType],
+    dictionaries: dict[str, list[str]],
+) -> dict[str, list[str]]:
+    """
+    Collect the distinct values of every Categorical column across the raw
+    files (one streaming pass) and append unseen ones to the dictionaries.
+
+    Existing categories keep their position, so codes already written to
+    Parquet never change; new values are appended in value order.
+    """
+    columns = categorical_columns(schema)
+    raw_names = {v: k for k, v in rename_map.items()}
+    scans = []
+    for file in files:
+        header = set(read_csv_header(file))
+        present = [col for col in columns if raw_names.get(col, col) in header]
+        scans.append(
+            pl.scan_csv(
+                file,
+                schema_overrides={raw_names.get(col, col): pl.Utf8 for col in present},
+                null_values=NULL_VALUES,
+            )
+            .rename(rename_map, strict=False)
+            .select(pl.col(col).drop_nulls().unique().implode() for col in present)
+        )
+
+    seen = {col: set() for col in columns}
+    with new_streaming_engine():
+        frames = pl.collect_all(scans)
+    for df in frames:
+        for col in df.columns:
+            seen[col].update(df[col][0])
+
+    updated = {}
+    for col in columns:
+        known = dictionaries.get(col, [])
+        new = sorted(seen[col].difference(known), key=_sort_key)
+        if new:
+            logger.info(f" {col}: {len(new):,} new categories")
+        updated[col] = known + new
+    return updated
+
+
+def enum_schema(
+    schema: dict[str, pl.DataType], dictionaries: dict[str, list[str]]
+) -> dict[str, pl.DataType]:
+    """Replace Categorical columns with fixed Enum types from the dictionaries."""
+    return {
+        col: pl.Enum(dictionaries[col]) if col in dictionaries else dtype
+        for col, dtype in schema.items()
+    }
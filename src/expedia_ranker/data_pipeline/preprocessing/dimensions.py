@@ -0,0 +1,137 @@
+from pathlib import Path
+
+import polars as pl
+
+from expedia_ranker.io.parquet_io import (
+    align_enums,
+    load_dictionaries,
+    scan_dataset,
+)
+from expedia_ranker.utilities.logging import logger
+
+# Dimension tables split off the impression facts: name -> key, attributes
+DIMENSIONS = {
+    "hotels": {
+        "key": "hotel_id",
+        "attributes": [
+            "hotel_country_id",
+            "hotel_star_rating",
+            "hotel_review_score",
+            "is_chain",
+            "location_score_primary",
+            "location_score_secondary",
+            "log_hist_price",
+        ],
+    },
+    "searches": {
+        "key": "search_id",
+        "attributes": [
+            "search_timestamp",
+            "expedia_site_id",
+            "user_country_id",
+            "user_hist_avg_stars",
+            "user_hist_avg_price",
+            "destination_id",
+            "stay_duration",
+            "days_until_checkin",
+            "num_adults",
+            "num_children",
+            "num_rooms",
+            "includes_sat_night",
+            "is_randomized",
+        ],
+    },
+}
+
+DIMENSIONS_DIR = "_dimensions"
+
+
+def dimension_path(output_dir: Path, name: str) -> Path:
+    """Return the path of the merged dimension table."""
+    return output_dir / f"{name}.parquet"
+
+
+def partial_dimension_path(output_dir: Path, name: str, stem: str) -> Path:
+    """Return the path of one raw file's contribution to a dimension."""
+    return output_dir / DIMENSIONS_DIR / name / f"{stem}.parquet"
+
+
+def dimension_columns(names: list[str]) -> list[str]:
+    """Return the fact columns moved into the given dimensions."""
+    return [col for name in names for col in DIMENSIONS[name]["attributes"]]
+
+
+def _last_known(lf: pl.LazyFrame, key: str, attributes: list[str], by: str):
+    """One row per key with the latest non-null value of every attribute."""
+    return lf.group_by(key).agg(
+        *[pl.col(col).sort_by(by).drop_nulls().last() for col in attributes],
+        pl.col(by).max(),
+    )
+
+
+def write_partial_dimension(
+    lf: pl.LazyFrame, output_dir: Path, name: str, stem: str
+) -> None:
+    """
+    Reduce one file's impressions to its dimension rows.
+    Attributes that change over time keep their last known value, with
+    the time it was last seen (`last_seen`) so partials can be merged.
+    """
+    spec = DIMENSIONS[name]
+    path = partial_dimension_path(output_dir, name, stem)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _last_known(
+        lf.with_columns(pl.col("search_timestamp").alias("last_seen")),
+        spec["key"],
+        spec["attributes"],
+        "last_seen",
+    ).collect().write_parquet(path)
+
+
+def merge_dimension(output_dir: Path, name: str) -> None:
+    """
+    Merge every file's partial dimension into one table keyed by the
+    dimension key, keeping the most recently seen values.
+    """
+    spec = DIMENSIONS[name]
+    partials = sorted((output_dir / DIMENSIONS_DIR / name).glob("*.parquet"))
+    if not partials:
+        return
+    dictionaries = load_dictionaries(output_dir)
+    merged = _last_known(
+        pl.concat(align_enums(pl.scan_parquet(p), dictionaries) for p in partials),
+        spec["key"],
+        spec["attributes"],
+        "last_seen",
+    ).collect()
+    merged.write_parquet(dimension_path(output_dir, name))
+    logger.info(f" {name} dimension: {merged.height:,} rows")
+
+
+def scan_with_dimensions(
+    fact_path: Path, columns: list[str] | None = None
+) -> pl.LazyFrame:
+    """
+    Lazily scan an impression file and join dimension attributes back.
+    A dimension is only joined when `columns` asks for one of its
+    attributes (or when `columns` is None, meaning every column).
+    Dimension tables are looked up next to the fact file or dataset.
+    """
+    lf = scan_dataset(fact_path)
+    fact_schema = lf.collect_schema()
+    present = fact_schema.names()
+    for name, spec in DIMENSIONS.items():
+        dim_path = dimension_path(fact_path.parent, name)
+        wanted = [
+            col
+            for col in spec["attributes"]
+            if col not in present and (columns is None or col in columns)
+        ]
+        if wanted and dim_path.exists():
+            dim = pl.scan_parquet(dim_path).select(spec["key"], *wanted)
+            key_dtype = dim.collect_schema()[spec["key"]]
+            if key_dtype != fact_schema[spec["key"]]:
+                # Enum key of a file converted before the dictionary grew
+                lf = lf.with_columns(pl.col(spec["key"]).cast(key_dtype))
+            lf = lf.join(dim, on=spec["key"], how="left")
+    return lf.select(columns) if columns is not None else lf
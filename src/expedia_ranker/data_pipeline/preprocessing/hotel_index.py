@@ -0,0 +1,163 @@
+from pathlib import Path
+
+import polars as pl
+import pyarrow.parquet as pq
+import pyarrow.types as pat
+
+from expedia_ranker.io.parquet_io import (
+    align_enums,
+    load_dictionaries,
+    parquet_files,
+    read_virtual_columns,
+    with_virtual_columns,
+)
+
+INDEX_KEY = "hotel_id"
+
+# Small row groups, so a lookup in the (sorted) index prunes by statistics
+_INDEX_ROW_GROUP_SIZE = 16_384
+
+
+def sort_by_hotel(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Cluster impressions by hotel_id, so every hotel lands in one or two
+    row groups and the index prunes. The order within a hotel is not kept
+    (the streaming sink rejects a stable sort). Like any sort, this holds
+    the data in memory before the sink.
+    """
+    return lf.sort(INDEX_KEY)
+
+
+def hotel_index_path(output_path: Path) -> Path:
+    """Return the hotel_id -> (file, row group) sidecar of an output."""
+    return output_path.parent / f"{output_path.name.split('.')[0]}.hotel_index.parquet"
+
+
+def zone_map_path(output_path: Path) -> Path:
+    """Return the per-row-group min/max sidecar of an output."""
+    return output_path.parent / f"{output_path.name.split('.')[0]}.zone_maps.parquet"
+
+
+def _zone_map_rows(file: Path, name: str) -> list[dict]:
+    """Min/max of every numeric column per row group, from the footer only."""
+    metadata = pq.read_metadata(file)
+    schema = metadata.schema.to_arrow_schema()
+    numeric = {
+        i: field.name
+        for i, field in enumerate(schema)
+        if pat.is_integer(field.type) or pat.is_floating(field.type)
+    }
+    rows = []
+    for rg in range(metadata.num_row_groups):
+        row_group = metadata.row_group(rg)
+        row = {"file": name, "row_group": rg, "num_rows": row_group.num_rows}
+        for i, col in numeric.items():
+            stats = row_group.column(i).statistics
+            has_stats = stats is not None and stats.has_min_max
+            row[f"{col}_min"] = float(stats.min) if has_stats else None
+            row[f"{col}_max"] = float(stats.max) if has_stats else None
+        rows.append(row)
+    return rows
+
+
+def write_hotel_index(output_path: Path) -> None:
+    """
+    Build the hotel_id index and the zone maps of a written output (flat
+    file or dataset directory). Only the hotel_id column and the footers
+    are read. File names are relative to the output's parent directory.
+
+    The index only prunes when hotels are clustered in few row groups,
+    so outputs are written in `sort_by_hotel` order; in search-ordered
+    files every hotel spans almost every row group.
+    """
+    index = []
+    zone_maps = []
+    for file in parquet_files(output_path):
+        name = file.relative_to(output_path.parent).as_posix()
+        parquet = pq.ParquetFile(file)
+        for rg in range(parquet.num_row_groups):
+            hotel_ids = pl.from_arrow(
+                parquet.read_row_group(rg, columns=[INDEX_KEY])
+            ).unique()
+            index.append(hotel_ids.with_columns(file=pl.lit(name), row_group=rg))
+        zone_maps += _zone_map_rows(file, name)
+
+    pl.concat(index).with_columns(pl.col("row_group").cast(pl.UInt32)).sort(
+        INDEX_KEY, "file", "row_group"
+    ).write_parquet(hotel_index_path(output_path), row_group_size=_INDEX_ROW_GROUP_SIZE)
+    pl.DataFrame(zone_maps, infer_schema_length=None).write_parquet(
+        zone_map_path(output_path)
+    )
+
+
+def _hive_values(name: str) -> dict[str, int | str]:
+    """Partition columns encoded in a dataset path (`col=value/...`)."""
+    values = {}
+    for part in Path(name).parts[:-1]:
+        if "=" in part:
+            key, value = part.split("=", 1)
+            values[key] = int(value) if value.isdigit() else value
+    return values
+
+
+def locate_hotels(
+    output_path: Path,
+    hotel_ids: list[int],
+    ranges: dict[str, tuple[float, float]] | None = None,
+) -> pl.DataFrame:
+    """
+    Return the (file, row_group) pairs that hold any of the hotels.
+    `ranges` ({column: (lo, hi)}) further drops row groups whose zone map
+    cannot overlap the range.
+    """
+    locations = (
+        pl.scan_parquet(hotel_index_path(output_path))
+        .filter(pl.col(INDEX_KEY).is_in(hotel_ids))
+        .select("file", "row_group")
+        .unique()
+    )
+    if ranges:
+        zone_maps = pl.scan_parquet(zone_map_path(output_path))
+        for col, (lo, hi) in ranges.items():
+            zone_maps = zone_maps.filter(
+                (pl.col(f"{col}_max") >= lo) & (pl.col(f"{col}_min") <= hi)
+            )
+        locations = locations.join(
+            zone_maps.select("file", "row_group"), on=["file", "row_group"]
+        )
+    return locations.sort("file", "row_group").collect()
+
+
+def read_hotels(
+    output_path: Path,
+    hotel_ids: list[int],
+    columns: list[str] | None = None,
+    ranges: dict[str, tuple[float, float]] | None = None,
+) -> pl.DataFrame:
+    """
+    Read the impressions of the given hotels, scanning only the files the
+    index points at. Outputs are clustered by hotel_id, so within a file
+    Polars skips the row groups whose hotel_id statistics exclude the
+    hotels, and decodes the other columns for matching rows only.
+    Partition columns of a dataset are restored from the file paths,
+    virtual columns from the footers. `ranges` is applied to the rows.
+    """
+    predicate = pl.col(INDEX_KEY).is_in(hotel_ids)
+    for col, (lo, hi) in (ranges or {}).items():
+        predicate &= pl.col(col).is_between(lo, hi)
+    dictionaries = load_dictionaries(output_path.parent)
+
+    frames = []
+    locations = locate_hotels(output_path, hotel_ids, ranges)
+    for name in locations["file"].unique(maintain_order=True):
+        lf = pl.scan_parquet(output_path.parent / name)
+        spec = read_virtual_columns(output_path.parent / name)
+        if spec:
+            lf = with_virtual_columns(lf, spec)
+        lf = lf.with_columns(pl.lit(v).alias(k) for k, v in _hive_values(name).items())
+        frames.append(align_enums(lf, dictionaries).filter(predicate))
+
+    if not frames:
+        return pl.DataFrame()
+    lf = pl.concat(frames, how="diagonal_relaxed")
+    return (lf.select(columns) if columns is not None else lf).collect()
@@ -0,0 +1,97 @@
+import hashlib
+from pathlib import Path
+from typing import Any
+
+from expedia_ranker.io.yaml_io import load_yaml, save_yaml
+
+MANIFEST_NAME = "_preprocess_manifest.yaml"
+
+_HASH_CHUNK_BYTES = 8 * 1024**2
+
+
+def file_sha256(path: Path) -> str:
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(_HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_fingerprint(config_paths: list[Path], options: dict[str, Any]) -> str:
+    """
+    Hash the config files and conversion options that shape the output.
+    A change to either invalidates every manifest entry.
+    """
+    digest = hashlib.sha256()
+    for path in config_paths:
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    digest.update(repr(sorted(options.items())).encode())
+    return digest.hexdigest()
+
+
+class PreprocessManifest:
+    """
+    Record of converted raw files, stored in the interim directory.
+    Each entry is keyed by input file name and holds its size, mtime,
+    content hash, the config fingerprint and the output path (relative to
+    the interim directory).
+    """
+
+    def __init__(self, output_dir: Path):
+        self.path = output_dir / MANIFEST_NAME
+        self.entries: dict[str, dict[str, Any]] = {}
+        if self.path.exists():
+            self.entries = load_yaml(self.path) or {}
+
+    def _fingerprint(self, input_path: Path) -> dict[str, Any]:
+        """
+        Size and mtime of the input. `record` adds the content hash when
+        the file is converted; `is_current` only re-hashes on a new mtime.
+        """
+        stat = input_path.stat()
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def is_current(self, input_path: Path, output_path: Path, config_hash: str) -> bool:
+        """
+        Return True if the input was already converted with the same config
+        and its output still exists.
+        Size and mtime are compared first; the file is only re-hashed when
+        they differ, so unchanged history costs one stat() per file.
+        """
+        entry = self.entries.get(input_path.name)
+        if not entry or entry["config_hash"] != config_hash:
+            return False
+        if not output_path.exists():
+            return False
+        fingerprint = self._fingerprint(input_path)
+        if fingerprint["size"] != entry["size"]:
+            return False
+        if fingerprint["mtime_ns"] == entry["mtime_ns"]:
+            return True
+        # Touched but possibly unchanged: fall back to the content hash
+        if file_sha256(input_path) != entry["sha256"]:
+            return False
+        entry["mtime_ns"] = fingerprint["mtime_ns"]
+        return True
+
+    def record(self, input_path: Path, output_path: Path, config_hash: str) -> None:
+        """Add or replace the entry for a successfully converted file."""
+        self.entries[input_path.name] = {
+            **self._fingerprint(input_path),
+            "sha256": file_sha256(input_path),
+            "config_hash": config_hash,
+            "output": output_path.relative_to(self.path.parent).as_posix(),
+        }
+
+    def relocate(self, old_outputs: set[str], new_output: Path) -> None:
+        """Point the entries whose output was merged elsewhere at new_output."""
+        new_name = new_output.relative_to(self.path.parent).as_posix()
+        for entry in self.entries.values():
+            if entry["output"] in old_outputs:
+                entry["output"] = new_name
+
+    def save(self) -> None:
+        """Write the manifest next to the outputs it describes."""
+        save_yaml(self.entries, self.path)
@@ -0,0 +1,38 @@
+import polars as pl
+
+PARTITION_SCHEMES = ("none", "month", "search_bucket")
+DEFAULT_N_BUCKETS = 32
+
+
+def search_bucket_expr(n_buckets: int = DEFAULT_N_BUCKETS) -> pl.Expr:
+    """
+    Stable bucket of a search: search_id modulo n_buckets.
+    Search IDs are sequential integers, so the modulo spreads queries evenly
+    and keeps every impression of a query in the same bucket, in any file.
+    """
+    return (
+        (pl.col("search_id").cast(pl.Utf8).cast(pl.Int64) % n_buckets)
+        .cast(pl.UInt16)
+        .alias("search_bucket")
+    )
+
+
+def partition_exprs(scheme: str, n_buckets: int = DEFAULT_N_BUCKETS) -> list[pl.Expr]:
+    """Return the expressions that derive the partition key columns."""
+    if scheme == "month":
+        return [
+            pl.col("search_timestamp").dt.year().alias("search_year"),
+            pl.col("search_timestamp").dt.month().alias("search_month"),
+        ]
+    if scheme == "search_bucket":
+        return [search_bucket_expr(n_buckets)]
+    if scheme == "none":
+        return []
+    raise ValueError(
+        f"Unknown partition scheme '{scheme}', expected one of {PARTITION_SCHEMES}"
+    )
+
+
+def partition_columns(scheme: str) -> list[str]:
+    """Return the hive partition column names for a scheme."""
+    return [expr.meta.output_name() for expr in partition_exprs(scheme)]
@@ -0,0 +1,162 @@
+import json
+from pathlib import Path
+from typing import Any
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from expedia_ranker.io.parquet_io import parquet_files
+
+# Size of the k-minimum-values sketch behind approx_distinct (~3% error)
+DEFAULT_SKETCH_SIZE = 1024
+
+_HASH_SPACE = 2**64
+
+
+def profile_path(output_path: Path) -> Path:
+    """Return the profile sidecar of an output file or dataset directory."""
+    return output_path.parent / f"{output_path.name.split('.')[0]}.profile.json"
+
+
+def _has_range(dtype: pl.DataType) -> bool:
+    """True for dtypes whose min and max are meaningful."""
+    return dtype.is_numeric() or dtype.is_temporal() or dtype == pl.Boolean
+
+
+class ColumnProfiler:
+    """
+    Per-column data-quality profile accumulated batch by batch:
+    null count, min, max, approximate distinct count and range violations.
+
+    `update_from_parquet` folds a written file (or dataset) batch by batch,
+    in bounded memory. This is a second read of the output: folding the
+    batches inside the streaming sink would need a Polars query per batch
+    callback, which deadlocks the new streaming engine. Distinct counts use
+    a k-minimum-values sketch of the value hashes, which merges across
+    batches in O(k).
+
+    Range violations are the values the schema dtype cannot represent.
+    Integers out of range already fail the typed scan, so only floats can
+    carry them, as non-finite values from an overflowing parse.
+    """
+
+    def __init__(self, sketch_size: int = DEFAULT_SKETCH_SIZE):
+        self.sketch_size = sketch_size
+        self.rows = 0
+        self.columns: dict[str, dict[str, Any]] = {}
+
+    def _batch_exprs(self, schema: pl.Schema) -> list[pl.Expr]:
+        exprs = []
+        for col, dtype in schema.items():
+            exprs.append(pl.col(col).null_count().alias(f"{col}:nulls"))
+            if not dtype.is_nested():
+                exprs.append(
+                    pl.col(col)
+                    .drop_nulls()
+                    .hash()
+                    .unique()
+                    .bottom_k(self.sketch_size)
+                    .implode()
+                    .alias(f"{col}:sketch")
+                )
+            if _has_range(dtype):
+                exprs += [
+                    pl.col(col).min().alias(f"{col}:min"),
+                    pl.col(col).max().alias(f"{col}:max"),
+                ]
+            if dtype.is_float():
+                exprs.append(
+                    (~pl.col(col).is_finite()).sum().alias(f"{col}:violations")
+                )
+        return exprs
+
+    def _fold(self, df: pl.DataFrame) -> None:
+        """Fold one batch into the profile."""
+        if df.height == 0:
+            return
+        stats = df.select(self._batch_exprs(df.schema)).row(0, named=True)
+        self.rows += df.height
+        for col, dtype in df.schema.items():
+            profile = self.columns.setdefault(
+                col,
+                {
+                    "dtype": str(dtype.base_type()),
+                    "nulls": 0,
+                    "violations": 0,
+                    "sketch": [],
+                    "sketched": not dtype.is_nested(),
+                },
+            )
+            profile["nulls"] += stats[f"{col}:nulls"]
+            profile["violations"] += stats.get(f"{col}:violations") or 0
+            profile["sketch"] = sorted(
+                set(profile["sketch"]).union(stats.get(f"{col}:sketch") or [])
+            )[: self.sketch_size]
+            for bound, pick in (("min", min), ("max", max)):
+                value = stats.get(f"{col}:{bound}")
+                if value is not None:
+                    current = profile.get(bound)
+                    profile[bound] = value if current is None else pick(current, value)
+
+    def update_from_parquet(
+        self, path: Path, batch_rows: int = 65_536
+    ) -> "ColumnProfiler":
+        """
+        Fold a Parquet file or dataset directory, `batch_rows` rows in
+        memory at a time. Slices are read by Polars, which reuses the memory
+        the sink has just freed. Hive partition keys live in the directory
+        names and are not profiled.
+        """
+        for file in parquet_files(path):
+            rows = pq.read_metadata(file).num_rows
+            for offset in range(0, rows, batch_rows):
+                self._fold(pl.scan_parquet(file).slice(offset, batch_rows).collect())
+        return self
+
+    def _approx_distinct(self, sketch: list[int]) -> int:
+        """Estimate distinct values from the k smallest hashes."""
+        if len(sketch) < self.sketch_size:
+            return len(sketch)  # every distinct hash was kept: exact
+        return round((self.sketch_size - 1) * _HASH_SPACE / (sketch[-1] + 1))
+
+    def summary(self) -> list[dict[str, Any]]:
+        """One record per column, in column order."""
+        return [
+            {
+                "column": col,
+                "dtype": profile["dtype"],
+                "rows": self.rows,
+                "null_count": profile["nulls"],
+                "null_fraction": profile["nulls"] / self.rows if self.rows else 0.0,
+                "min": profile.get("min"),
+                "max": profile.get("max"),
+                "approx_distinct": (
+                    self._approx_distinct(profile["sketch"])
+                    if profile["sketched"]
+                    else None
+                ),
+                "range_violations": profile["violations"],
+            }
+            for col, profile in self.columns.items()
+        ]
+
+    def save(self, output_path: Path) -> Path:
+        """Write the profile as a JSON sidecar next to the output."""
+        path = profile_path(output_path)
+        with path.open("w") as f:
+            json.dump(self.summary(), f, indent=2, default=str)
+        return path
+
+
+def load_profile(output_path: Path) -> pl.DataFrame:
+    """
+    Load the profile sidecar of a converted file as a DataFrame, one row
+    per column. min and max are kept as text, since their types differ.
+    """
+    with profile_path(output_path).open() as f:
+        records = json.load(f)
+    for record in records:
+        for bound in ("min", "max"):
+            if record[bound] is not None:
+                record[bound] = str(record[bound])
+    return pl.DataFrame(records)
@@ -0,0 +1,174 @@
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+
+from expedia_ranker.io.parquet_io import (
+    iter_parquet_batches,
+    read_virtual_columns,
+    scan_dataset,
+    with_virtual_columns,
+)
+from expedia_ranker.io.yaml_io import load_yaml, save_yaml
+
+QUERY_SORT_COLUMNS = ["search_id", "display_position"]
+
+
+def search_id_value_expr() -> pl.Expr:
+    """Numeric value of search_id, whatever its stored dtype."""
+    return pl.col("search_id").cast(pl.Utf8).cast(pl.Int64)
+
+
+def sort_by_query(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Order impressions by search_id (numerically), then display_position.
+    Test files have no positions; their nulls go last, and a virtual
+    (left out) display_position is not sorted on at all.
+    The key is materialized as a column because the streaming sink cannot
+    sort by an expression.
+    """
+    keys = ["__search_key"]
+    if "display_position" in lf.collect_schema().names():
+        keys.append("display_position")
+    return (
+        lf.with_columns(search_id_value_expr().alias("__search_key"))
+        .sort(keys, nulls_last=True)
+        .drop("__search_key")
+    )
+
+
+def query_index_path(output_path: Path) -> Path:
+    """Return the sidecar path that maps search_id ranges to row groups."""
+    return output_path.with_suffix(".query_index.yaml")
+
+
+def _search_id_values(df: pl.DataFrame) -> np.ndarray:
+    """Return search_id as an int64 array."""
+    return df.select(search_id_value_expr()).to_series().to_numpy()
+
+
+def _query_boundary(keys: np.ndarray, target_rows: int) -> int | None:
+    """
+    Return the row offset of the last query start at or before target_rows.
+    A single query larger than target_rows ends at its own boundary.
+    Returns None if the buffer ends mid-query and more rows are needed.
+    """
+    starts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    if starts.size == 0:
+        return None
+    fitting = starts[starts <= target_rows]
+    return int(fitting[-1]) if fitting.size else int(starts[0])
+
+
+def write_query_aligned(
+    source_path: Path,
+    output_path: Path,
+    row_group_size: int,
+    metadata: dict[bytes, bytes] | None = None,
+) -> list[dict]:
+    """
+    Rewrite a query-sorted Parquet file so that row groups end only at
+    search_id boundaries, and save the search_id range of every row group
+    to a YAML sidecar (see `query_index_path`).
+    Batches are streamed, so at most about two row groups are in memory.
+    `metadata` is added to the footer.
+    """
+    index = []
+    writer = None
+
+    def write_group(df: pl.DataFrame) -> None:
+        nonlocal writer
+        table = df.to_arrow()
+        if writer is None:
+            # Only the leading key: Polars reads every sorting column as
+            # sorted on its own, so display_position (sorted only within a
+            # query) would get wrong min/max and search results
+            sorting_columns = [
+                pq.SortingColumn(df.columns.index("search_id"), nulls_first=False)
+            ]
+            writer = pq.ParquetWriter(
+                output_path,
+                table.schema.with_metadata(
+                    {**(table.schema.metadata or {}), **(metadata or {})}
+                ),
+                compression="zstd",
+                sorting_columns=sorting_columns,
+            )
+        keys = _search_id_values(df)
+        index.append(
+            {
+                "row_group": len(index),
+                "search_id_min": int(keys[0]),
+                "search_id_max": int(keys[-1]),
+                "num_rows": df.height,
+            }
+        )
+        writer.write_table(table, row_group_size=df.height)
+
+    buffer = None
+    for batch in iter_parquet_batches(source_path):
+        buffer = batch if buffer is None else pl.concat([buffer, batch])
+        while buffer.height >= row_group_size:
+            cut = _query_boundary(_search_id_values(buffer), row_group_size)
+            if cut is None:
+                break
+            write_group(buffer.slice(0, cut))
+            buffer = buffer.slice(cut)
+    if buffer is not None and buffer.height:
+        write_group(buffer)
+    if writer is not None:
+        writer.close()
+
+    save_yaml(
+        {"sorted_by": QUERY_SORT_COLUMNS, "row_groups": index},
+        query_index_path(output_path),
+    )
+    return index
+
+
+def _is_value_ordered(dtype: pl.DataType) -> bool:
+    """True if the physical order of search_id follows its numeric value."""
+    if dtype.is_integer():
+        return True
+    if isinstance(dtype, pl.Enum):
+        values = [int(c) for c in dtype.categories if c.isdigit()]
+        return len(values) == len(dtype.categories) and values == sorted(values)
+    return False
+
+
+def scan_query_sorted(path: Path) -> pl.LazyFrame:
+    """
+    Scan a query-sorted file and flag search_id as sorted, so group-by and
+    window operations over queries can skip hashing and re-sorting.
+    The flag is only set when the physical order of search_id follows its
+    value (integers, or an Enum whose categories are in numeric order);
+    Categorical codes follow first appearance instead.
+    """
+    lf = scan_dataset(path)
+    if _is_value_ordered(lf.collect_schema()["search_id"]):
+        lf = lf.set_sorted("search_id")
+    return lf
+
+
+def read_query_range(
+    path: Path, search_id_min: int, search_id_max: int
+) -> pl.DataFrame:
+    """
+    Read the impressions of searches in [search_id_min, search_id_max],
+    touching only the row groups the sidecar index says overlap the range.
+    """
+    index = load_yaml(query_index_path(path))["row_groups"]
+    row_groups = [
+        rg["row_group"]
+        for rg in index
+        if rg["search_id_max"] >= search_id_min and rg["search_id_min"] <= search_id_max
+    ]
+    table = pq.ParquetFile(path).read_row_groups(row_groups)
+    lf = pl.from_arrow(table).lazy()
+    spec = read_virtual_columns(path)
+    if spec:
+        lf = with_virtual_columns(lf, spec)
+    return lf.filter(
+        search_id_value_expr().is_between(search_id_min, search_id_max)
+    ).collect()
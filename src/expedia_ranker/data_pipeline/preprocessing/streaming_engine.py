@@ -0,0 +1,26 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def new_streaming_engine(morsel_size: int | None = None):
+    """
+    Run the queries started inside the block on the new streaming engine,
+    with `morsel_size` rows per morsel. Polars 1.24 only selects it through
+    environment variables, read when a query starts; the old engine ignores
+    row_group_size and the chunk size setting of sink_parquet, and
+    `collect(streaming=True)` is deprecated.
+    """
+    settings = {"POLARS_FORCE_NEW_STREAMING": "1"}
+    if morsel_size is not None:
+        settings["POLARS_IDEAL_MORSEL_SIZE"] = str(morsel_size)
+    previous = {key: os.environ.get(key) for key in settings}
+    os.environ.update(settings)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
@@ -0,0 +1,104 @@
+# Arrow IPC (Feather v2) mirror of Parquet data
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import polars as pl
+
+from expedia_ranker.io.parquet_io import (
+    align_enums,
+    load_dictionaries,
+    parquet_files,
+    scan_dataset,
+)
+from expedia_ranker.utilities.logging import logger
+
+IPC_SUFFIX = ".arrow"
+
+# Uncompressed mirrors are memory-mapped zero-copy; LZ4 trades that for size
+IPC_COMPRESSIONS = ("uncompressed", "lz4")
+
+
+def ipc_mirror_path(path: Path, compression: str = "uncompressed") -> Path:
+    """
+    Return the IPC mirror path of a Parquet file or dataset directory:
+    `train.parquet` -> `train.arrow`, `train/` -> `train.arrow`. Compressed
+    mirrors carry their compression in the name (`train.lz4.arrow`), since
+    the IPC sink cannot record it in the file's metadata.
+    """
+    suffix = (
+        IPC_SUFFIX if compression == "uncompressed" else f".{compression}{IPC_SUFFIX}"
+    )
+    if path.is_dir():
+        return path.parent / f"{path.name}{suffix}"
+    return path.with_suffix(suffix)
+
+
+def _source_mtime_ns(path: Path) -> int:
+    """Latest mtime of the Parquet file, or of any file of the dataset."""
+    return max(p.stat().st_mtime_ns for p in parquet_files(path))
+
+
+def is_mirror_current(path: Path, compression: str = "uncompressed") -> bool:
+    """
+    True if a mirror with this compression exists and was written from the
+    current source. The mirror carries its source's mtime, so any rewrite
+    of the Parquet data (newer or restored from an older copy) invalidates
+    it; a mirror of another compression is never current.
+    """
+    mirror = ipc_mirror_path(path, compression)
+    return mirror.exists() and mirror.stat().st_mtime_ns == _source_mtime_ns(path)
+
+
+def sync_ipc_mirror(path: Path, compression: str = "uncompressed") -> Path:
+    """
+    Write (or refresh) the IPC mirror of a Parquet file or dataset.
+    The source is streamed into a temporary file that replaces the mirror
+    atomically, so readers never map a half-written file. Mirrors of the
+    other compressions are deleted: switching compression replaces the
+    mirror instead of keeping both.
+    """
+    if compression not in IPC_COMPRESSIONS:
+        raise ValueError(
+            f"Unknown IPC compression '{compression}', "
+            f"expected one of {IPC_COMPRESSIONS}"
+        )
+    mirror = ipc_mirror_path(path, compression)
+    if is_mirror_current(path, compression):
+        return mirror
+    source_mtime = _source_mtime_ns(path)
+    tmp_path = mirror.with_suffix(".tmp" + IPC_SUFFIX)
+    scan_dataset(path).sink_ipc(
+        tmp_path, compression=None if compression == "uncompressed" else compression
+    )
+    os.replace(tmp_path, mirror)
+    os.utime(mirror, ns=(source_mtime, source_mtime))
+    for other in IPC_COMPRESSIONS:
+        if other != compression:
+            ipc_mirror_path(path, other).unlink(missing_ok=True)
+    logger.info(f" IPC mirror refreshed: {mirror.name}")
+    return mirror
+
+
+def scan_ipc_mirror(path: Path, compression: str = "uncompressed") -> pl.LazyFrame:
+    """
+    Lazily scan the memory-mapped IPC mirror of a Parquet file or dataset,
+    refreshing the mirror first if the source has changed.
+    Repeat reads of an uncompressed mirror are served from the page cache
+    without decoding. Enum columns are cast to the current dictionaries,
+    as in `scan_dataset`: a mirror keeps the ones of its source's write.
+    """
+    lf = pl.scan_ipc(sync_ipc_mirror(path, compression), memory_map=True)
+    return align_enums(lf, load_dictionaries(path.parent))
+
+
+def read_ipc_mirror(
+    path: Path,
+    columns: Optional[List[str]] = None,
+    compression: str = "uncompressed",
+) -> pl.DataFrame:
+    """Eagerly read (a column subset of) the memory-mapped IPC mirror."""
+    df = pl.read_ipc(
+        sync_ipc_mirror(path, compression), columns=columns, memory_map=True
+    )
+    return align_enums(df.lazy(), load_dictionaries(path.parent)).collect()
@@ -0,0 +1,219 @@
+# Parquet I/O utilities
+import json
+import shutil
+from itertools import chain
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import polars as pl
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Key-value metadata entry listing the constant columns left out of a file
+VIRTUAL_COLUMNS_KEY = b"expedia_ranker.virtual_columns"
+# Category lists of the Enum columns, shared by every output of a directory
+DICTIONARIES_NAME = "_category_dictionaries.parquet"
+
+
+def _is_hidden(path: Path, root: Path) -> bool:
+    """True if any directory below root starts with "_" (Hive convention)."""
+    return any(part.startswith("_") for part in path.relative_to(root).parts[:-1])
+
+
+def parquet_files(path: Path) -> List[Path]:
+    """
+    Return the Parquet file itself, or every file of a dataset directory.
+    Directories starting with "_" (staging, shards metadata) are skipped.
+    """
+    if not path.is_dir():
+        return [path]
+    return sorted(p for p in path.rglob("*.parquet") if not _is_hidden(p, path))
+
+
+def iter_parquet_batches(
+    file_path: Path, batch_rows: int = 65_536
+) -> Iterator[pl.DataFrame]:
+    """
+    Stream a Parquet file as Polars DataFrames, one record batch at a time.
+    Route Arrow data through Polars before handing it back to pyarrow
+    writers: Polars can only read back the dictionary layout it exports
+    itself (uint32 indices) for Categorical and Enum columns.
+    """
+    for batch in pq.ParquetFile(file_path).iter_batches(batch_size=batch_rows):
+        yield pl.from_arrow(batch)
+
+
+def load_dictionaries(output_dir: Path) -> Dict[str, List[str]]:
+    """Load the persisted category lists, in code order."""
+    path = output_dir / DICTIONARIES_NAME
+    if not path.exists():
+        return {}
+    df = pl.read_parquet(path)
+    return {
+        col: group["category"].to_list()
+        for (col,), group in df.group_by("column", maintain_order=True)
+    }
+
+
+def align_enums(lf: pl.LazyFrame, dictionaries: Dict[str, List[str]]) -> pl.LazyFrame:
+    """
+    Cast Enum columns of an older file to the current dictionaries.
+    Dictionaries only grow by appending, so every existing code keeps its
+    meaning and files converted at different times concatenate cleanly.
+    """
+    present = lf.collect_schema().names()
+    return lf.with_columns(
+        pl.col(col).cast(pl.Enum(cats))
+        for col, cats in dictionaries.items()
+        if col in present
+    )
+
+
+def _enum_sizes(file_path: Path) -> tuple:
+    """Number of categories of every Enum column, from the footer only."""
+    return tuple(
+        (col, len(dtype.categories))
+        for col, dtype in pl.scan_parquet(file_path).collect_schema().items()
+        if isinstance(dtype, pl.Enum)
+    )
+
+
+def read_virtual_columns(file_path: Path) -> Dict[str, Any] | None:
+    """
+    Return the virtual column spec stored in a Parquet footer, or None:
+    {"columns": {name: {"dtype": ..., "value": ...}}, "order": [...]}.
+    """
+    metadata = pq.read_schema(file_path).metadata or {}
+    spec = metadata.get(VIRTUAL_COLUMNS_KEY)
+    return json.loads(spec) if spec else None
+
+
+def with_virtual_columns(lf: pl.LazyFrame, spec: Dict[str, Any]) -> pl.LazyFrame:
+    """
+    Add the virtual columns of a spec as literals and restore the stored
+    column order. Literals are only evaluated when a query projects them.
+    Columns the frame does not carry (e.g. split off into a dimension
+    table) are left out of the order.
+    """
+    lf = lf.with_columns(
+        pl.lit(column["value"], dtype=getattr(pl, column["dtype"])).alias(name)
+        for name, column in spec["columns"].items()
+    )
+    present = lf.collect_schema().names()
+    order = [col for col in spec["order"] if col in present]
+    return lf.select(*order, *(col for col in present if col not in order))
+
+
+def add_parquet_metadata(file_path: Path, metadata: Dict[bytes, bytes]) -> None:
+    """
+    Add key-value metadata to an existing Parquet file. The Polars writers
+    take no metadata, so the file is copied row group by row group (row
+    groups are kept as they are) and swapped in place: a full extra pass.
+    """
+    tmp_path = file_path.with_suffix(".metadata.tmp")
+    parquet = pq.ParquetFile(file_path)
+    writer = None
+    for rg in range(parquet.num_row_groups):
+        table = pl.from_arrow(parquet.read_row_group(rg)).to_arrow()
+        writer = writer or pq.ParquetWriter(
+            tmp_path,
+            table.schema.with_metadata({**(table.schema.metadata or {}), **metadata}),
+            compression="zstd",
+        )
+        writer.write_table(table, row_group_size=table.num_rows)
+    if writer is not None:
+        writer.close()
+        tmp_path.replace(file_path)
+
+
+def read_parquet_stats(file_path: Path) -> Dict[str, Any]:
+    """
+    Return row, column, row-group and size stats from Parquet footers.
+    Works on a single file or a hive-partitioned dataset directory.
+    Only the metadata is read, never the data pages.
+    """
+    if not file_path.exists():
+        raise FileNotFoundError(f"Parquet file not found: {file_path}")
+    stats = {"rows": 0, "columns": 0, "row_groups": 0, "size_mb": 0.0}
+    for path in parquet_files(file_path):
+        metadata = pq.read_metadata(path)
+        stats["rows"] += metadata.num_rows
+        stats["columns"] = max(stats["columns"], metadata.num_columns)
+        stats["row_groups"] += metadata.num_row_groups
+        stats["size_mb"] += path.stat().st_size / 1024**2
+    return stats
+
+
+def write_hive_dataset(
+    source_path: Path,
+    dataset_dir: Path,
+    partition_cols: List[str],
+    row_group_size: int,
+    preserve_order: bool = False,
+    metadata: Dict[bytes, bytes] | None = None,
+) -> None:
+    """
+    Stream a flat Parquet file into a hive-partitioned dataset
+    (`dataset_dir/col=value/.../part-0.parquet`), batch by batch.
+    Any previous dataset at `dataset_dir` is replaced.
+    `preserve_order` keeps the source row order within each partition,
+    at the cost of a single-threaded write. `metadata` is added to the
+    footer of every file.
+    """
+    if dataset_dir.exists():
+        shutil.rmtree(dataset_dir)
+    tables = (df.to_arrow() for df in iter_parquet_batches(source_path))
+    first = next(tables)
+    ds.write_dataset(
+        (batch for table in chain([first], tables) for batch in table.to_batches()),
+        dataset_dir,
+        schema=first.schema.with_metadata(
+            {**(first.schema.metadata or {}), **(metadata or {})}
+        ),
+        format="parquet",
+        partitioning=partition_cols,
+        partitioning_flavor="hive",
+        basename_template="part-{i}.parquet",
+        min_rows_per_group=min(row_group_size, 1 << 17),
+        max_rows_per_group=row_group_size,
+        max_rows_per_file=0,
+        use_threads=not preserve_order,
+    )
+
+
+def scan_dataset(path: Path, **kwargs: Any) -> pl.LazyFrame:
+    """
+    Lazily scan a Parquet file or a hive-partitioned dataset directory.
+    Partition columns are exposed as regular columns, so filters on them
+    skip whole directories. Directories starting with "_" are not part of
+    the dataset (e.g. files staged for the next compaction).
+    Virtual columns recorded in the footer (see `read_virtual_columns`)
+    are added back as literals, in their stored position.
+    Enum columns are cast to the dictionaries saved next to the output
+    (see `load_dictionaries`), so files converted before a dictionary grew
+    scan, concatenate and join with newer ones.
+    """
+    if not path.exists():
+        raise FileNotFoundError(f"Parquet dataset not found: {path}")
+    files = parquet_files(path)
+    dictionaries = load_dictionaries(path.parent)
+    if not path.is_dir():
+        lf = pl.scan_parquet(path, **kwargs)
+    elif dictionaries and len({_enum_sizes(file) for file in files}) > 1:
+        # Polars will not scan Enums of different sizes together
+        lf = pl.concat(
+            [
+                align_enums(
+                    pl.scan_parquet(file, hive_partitioning=True, **kwargs),
+                    dictionaries,
+                )
+                for file in files
+            ],
+            how="vertical_relaxed",
+        )
+    else:
+        lf = pl.scan_parquet(files, hive_partitioning=True, **kwargs)
+    if dictionaries:
+        lf = align_enums(lf, dictionaries)
+    spec = read_virtual_columns(files[0]) if files else None
+    return with_virtual_columns(lf, spec) if spec else lf
@@ -30,6 +30,11 @@ def get_feature_file_path(feature_name: str, version: str) -> Path:
     return DATA_PROCESSED_DIR / f"{feature_name}_v{version}.parquet"
 
 
+def get_feature_dataset_dir(feature_name: str, version: str) -> Path:
+    """Return the directory for a versioned, hive-partitioned feature dataset."""
+    return DATA_PROCESSED_DIR / f"{feature_name}_v{version}"
+
+
 def get_feature_schema_path() -> Path:
     """Return the path to the feature schema YAML file."""
     path = CONFIG_FEATURES_DIR / "schema.yaml"
@@ -0,0 +1,31 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def polars_thread_budget(workers: int) -> int:
+    """Split the available cores evenly across worker processes."""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def init_polars_worker(n_threads: int) -> None:
+    """
+    Cap the Polars thread pool of a worker process.
+    Polars sizes its pool lazily on first use, so setting the variable
+    here (before any query runs) is enough.
+    """
+    os.environ["POLARS_MAX_THREADS"] = str(n_threads)
+
+
+def polars_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool of `workers` workers sharing the cores, each with its own
+    capped Polars thread pool. Workers are spawned: forking a process whose
+    Polars pool is already live can deadlock the child.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_polars_worker,
+        initargs=(polars_thread_budget(workers),),
+    )
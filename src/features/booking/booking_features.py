@@ -29,6 +29,20 @@ def booking_stats_features() -> List[pl.Expr]:
     ]
 
 
+def hotel_booking_stats_table(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    The `booking_stats_features` as one row per hotel, from a single
+    group_by, so they can be computed once and joined to any subset of
+    the impressions.
+    """
+    return lf.group_by("hotel_id").agg(
+        (pl.col("was_clicked").sum() / pl.len()).alias("click_prob"),
+        (pl.col("was_booked").sum() / pl.len()).alias("booking_prob"),
+        pl.col("display_position").mean().alias("hotel_avg_position"),
+        pl.col("display_position").std().alias("hotel_position_std"),
+    )
+
+
 def query_level_flags() -> List[pl.Expr]:
     """
     Generate flags indicating query-level characteristics:
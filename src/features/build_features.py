@@ -2,12 +2,15 @@
 
 import polars as pl
 from pathlib import Path
+from typing import List, Optional
 
 # Hotel features
-from hotel.hotel_entropy import (
-    hotel_click_entropy_price_tier,
-)  # Modified to work with LazyFrames
-from hotel.hotel_rolling_features import hotel_rolling_features
+from hotel.hotel_entropy import hotel_entropy_features
+from hotel.hotel_rolling_features import (
+    hotel_rolling_stats,
+    ROLLING_LAG_DAYS,
+    ROLLING_WINDOWS,
+)
 from hotel.location_features import location_score_features
 
 # User features
@@ -21,24 +24,59 @@ from booking.booking_features import booking_stats_features, query_level_flags
 
 # Search features
 from search.search_context_features import search_context_features
-from search.search_temporal_features import (
-    search_time_features,
-    booking_time_features,
+from search.calendar_features import (
+    calendar_time_features,
+    checkin_holiday_features,
+    search_calendar_features,
 )
+from search.query_relative_features import query_relative_features
 
 # Competitor features
 from competitor.competitor_features import (
     competitor_inv_features,
     competitor_rate_features,
     competitor_price_diff_features,
+    PACKED_COMPETITOR_MASK,
 )
 
+# Registry-driven planning of a feature subset
+from feature_planner import build_planned_features
+
 from utils.memory_utils import optimize_memory
 from utils.load_yaml import load_yaml
 from utils.feature_utils import mad_filter, groupwise_mean_imputation
 
 
-def build_features(lf: pl.LazyFrame) -> pl.LazyFrame:
+def build_search_features(searches: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Compute the query-level features on a searches table (one row per
+    search_id), so date arithmetic and holiday lookups run once per query
+    instead of once per impression. The check-in holidays depend on the
+    hotel's country and are added after the join.
+
+    Parameters:
+    -----------
+    searches : pl.LazyFrame
+        Searches dimension table written by `preprocess --dimension searches`
+
+    Returns:
+    --------
+    pl.LazyFrame
+        Searches table with calendar and context features added
+    """
+    return search_calendar_features(searches).with_columns(
+        [
+            *search_context_features(),
+        ]
+    )
+
+
+def build_features(
+    lf: pl.LazyFrame,
+    searches: Optional[pl.LazyFrame] = None,
+    features: Optional[List[str]] = None,
+    query_sorted: bool = False,
+) -> pl.LazyFrame:
     """
     Build features using LazyFrame operations throughout the pipeline.
 
@@ -46,29 +84,63 @@ def build_features(lf: pl.LazyFrame) -> pl.LazyFrame:
     -----------
     lf : pl.LazyFrame
         Input LazyFrame with raw data
+    searches : pl.LazyFrame, optional
+        Searches dimension table. When given, the search-level features are
+        computed on it and joined to the impressions on search_id, and the
+        impression-level steps skip them.
+    features : List[str], optional
+        Output columns to build. When given, only these features and their
+        dependencies from the feature registry are computed, only the raw
+        columns they read are projected, and the result holds exactly these
+        columns (see `feature_planner`).
+    query_sorted : bool
+        True if `lf` is sorted by search_id (e.g. read with
+        `scan_query_sorted`): the query-relative features then segment the
+        queries contiguously instead of hashing them.
 
     Returns:
     --------
     pl.LazyFrame
         LazyFrame with all features added
     """
+    if features is not None:
+        if searches is not None:
+            lf = lf.join(
+                searches.drop(
+                    [c for c in lf.collect_schema().names() if c != "search_id"],
+                    strict=False,
+                ),
+                on="search_id",
+                how="left",
+            )
+        return build_planned_features(lf, features)
+
     print("Starting feature building pipeline in lazy mode...")
 
     # ============ Step 1: Precompute dependencies ============
 
-    print("[1/7] Creating intermediate time columns...")
-    lf = lf.with_columns(
-        [
-            *search_time_features(),
-            *booking_time_features(),  # needs expected_checkin_date
-        ]
-    )
+    if searches is not None:
+        print("[1/7] Computing search-level features on the searches table...")
+        search_features = build_search_features(searches)
+        lf = lf.join(
+            search_features.drop(
+                [c for c in lf.collect_schema().names() if c != "search_id"],
+                strict=False,
+            ),
+            on="search_id",
+            how="left",
+        )
+        lf = checkin_holiday_features(lf)
+    else:
+        print("[1/7] Joining calendar features...")
+        lf = calendar_time_features(lf)  # date parts and holidays by country
 
     # ============ Step 2: Hotel features ============
     print("[2/7] Applying hotel features...")
+    # Daily pre-aggregated, over the days before the search day
+    lf = hotel_rolling_stats(lf, windows=ROLLING_WINDOWS, lag_days=ROLLING_LAG_DAYS)
     lf = lf.with_columns(
         [
-            *hotel_rolling_features(window_size=7),  # needs search_date
             *location_score_features(),
         ]
     )
@@ -88,38 +160,58 @@ def build_features(lf: pl.LazyFrame) -> pl.LazyFrame:
         [
             *booking_stats_features(),
             *query_level_flags(),
-            *booking_time_features(),  # needs expected_checkin_date
         ]
     )
+    lf = query_relative_features(lf, query_sorted=query_sorted)  # one grouped pass
 
     # ============ Step 5: Search context features ============
     print("[5/7] Applying search context features...")
-    lf = lf.with_columns(
-        [
-            *search_context_features(),
-        ]
-    )
+    if searches is None:
+        lf = lf.with_columns(
+            [
+                *search_context_features(),
+            ]
+        )
 
     # ============ Step 6: Competitor features ============
     print("[6/7] Applying competitor features...")
+    packed = PACKED_COMPETITOR_MASK in lf.collect_schema().names()
     lf = lf.with_columns(
         [
-            *competitor_inv_features(),
-            *competitor_rate_features(),
-            *competitor_price_diff_features(),
+            *competitor_inv_features(packed),
+            *competitor_rate_features(packed),
+            *competitor_price_diff_features(packed),
         ]
     )
 
     # ============ Step 7: Apply entropy features in lazy mode ============
     print("[7/7] Applying entropy features in lazy mode...")
-    lf = hotel_click_entropy_price_tier(
-        lf
-    )  # Modified version that works with LazyFrames
+    lf = hotel_entropy_features(lf)  # every dimension in one aggregation
 
     print("✅ Feature building pipeline completed (lazy mode).")
     return lf
 
 
+def save_features(
+    df: pl.DataFrame,
+    output_path: Path,
+    partition_by: Optional[List[str]] = None,
+) -> None:
+    """
+    Save the feature matrix as a single Parquet file, or as a hive-partitioned
+    dataset directory (e.g. partition_by=["search_year", "search_month"]).
+
+    Read partitioned output back with
+    `pl.scan_parquet(output_path / "**/*.parquet", hive_partitioning=True)`
+    so filters on the partition columns skip whole directories.
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if partition_by:
+        df.write_parquet(output_path, partition_by=partition_by)
+    else:
+        df.write_parquet(output_path)
+
+
 # ==========================
 # Test block for sanity check
 # ==========================
@@ -127,7 +219,11 @@ if __name__ == "__main__":
     # === CONFIG ===
     DATA_DIR = Path("data")
     RAW_PATH = DATA_DIR / "raw" / "train.csv"
+    INTERIM_PATH = DATA_DIR / "interim" / "train.parquet"  # used if present
     PROCESSED_PATH = DATA_DIR / "processed" / "features.parquet"
+    PARTITION_BY = None  # e.g. ["search_year", "search_month"]
+    FEATURE_STORE_DIR = DATA_DIR / "processed" / "feature_store"  # None = off
+    DEV_SAMPLE_ROWS = 100_000  # full dataset: partitioned_build.py (out of core)
     RENAME_MAP_PATH = Path("src/configs/feature_rename_map.yaml")
     DTYPES_MAP_PATH = Path("src/configs/downcast_dtypes_map.yaml")
 
@@ -139,9 +235,17 @@ if __name__ == "__main__":
     dtypes_config = load_yaml(DTYPES_MAP_PATH)
     dtypes = {k: getattr(pl, v) for k, v in dtypes_config.items()}
 
-    # Load raw dataset (lazy, from CSV)
-    lf_raw = pl.scan_csv(RAW_PATH, null_values=["NULL"], try_parse_dates=True)
-    lf_raw = lf_raw.rename(rename_map, strict=False).cast(dtypes, strict=True)
+    if INTERIM_PATH.exists():
+        # Memory-mapped Arrow mirror of the interim Parquet (refreshed by mtime)
+        from expedia_ranker.io.ipc_io import scan_ipc_mirror
+        from utils.interim_schema import interim_to_features
+
+        # Preprocessing names and Enum IDs -> the CSV's feature names and types
+        lf_raw = interim_to_features(scan_ipc_mirror(INTERIM_PATH), rename_map, dtypes)
+    else:
+        # Load raw dataset (lazy, from CSV)
+        lf_raw = pl.scan_csv(RAW_PATH, null_values=["NULL"], try_parse_dates=True)
+        lf_raw = lf_raw.rename(rename_map, strict=False).cast(dtypes, strict=True)
 
     # === Preprocessing (MAD Filtering + Imputation) ===
     lf_raw = mad_filter(lf_raw, input_column="display_price", z_thresh=3.5)
@@ -152,10 +256,22 @@ if __name__ == "__main__":
     )
 
     # === Development Sample ===
-    lf_dev_sample = lf_raw.limit(100_000)
+    lf_dev_sample = lf_raw.limit(DEV_SAMPLE_ROWS)
 
     # === Feature Engineering ===
-    lf_features = build_features(lf_dev_sample)
+    if FEATURE_STORE_DIR is not None and INTERIM_PATH.exists():
+        # Reuse every feature group whose inputs and code are unchanged
+        from feature_store import FeatureStore, dataset_fingerprint
+
+        dataset_key = (
+            f"{dataset_fingerprint(INTERIM_PATH)}:mad=display_price,3.5:"
+            f"impute=hotel_id:rows={DEV_SAMPLE_ROWS}"
+        )
+        lf_features = FeatureStore(FEATURE_STORE_DIR).assemble(
+            lf_dev_sample, dataset_key
+        )
+    else:
+        lf_features = build_features(lf_dev_sample)
 
     # === Collect & Save ===
     print("\n[TEST] Collecting final results...")
@@ -166,7 +282,9 @@ if __name__ == "__main__":
     )
 
     print("\n[SAVE] Writing final DataFrame to Parquet...")
-    df_features_final.write_parquet(PROCESSED_PATH)
+    if PARTITION_BY:
+        PROCESSED_PATH = PROCESSED_PATH.with_suffix("")
+    save_features(df_features_final, PROCESSED_PATH, partition_by=PARTITION_BY)
     print(f"[✓] Saved to {PROCESSED_PATH.resolve()}")
 
     # Optional: For large datasets, you could use streaming mode
@@ -3,7 +3,23 @@ import polars as pl
 from typing import List
 
 
-def competitor_rate_features() -> List[pl.Expr]:
+# Packed competitor block (preprocess --pack-competitors): bit i = competitor i+1
+PACKED_COMPETITOR_MASK = "comp_rate_valid_mask"
+
+
+def _popcount(mask: str) -> pl.Expr:
+    return pl.col(mask).bitwise_count_ones().cast(pl.Int8)
+
+
+def competitor_rate_features(packed: bool = False) -> List[pl.Expr]:
+    if packed:
+        return [
+            _popcount("comp_cheaper_mask").alias("num_comp_cheaper"),
+            _popcount("comp_same_price_mask").alias("num_comp_same_price"),
+            _popcount("comp_more_expensive_mask").alias("num_comp_more_expensive"),
+            _popcount("comp_rate_valid_mask").alias("num_valid_comp_rate"),
+        ]
+
     comp_rate_cols = [f"comp{i}_rate" for i in range(1, 9)]
 
     return [
@@ -22,7 +38,13 @@ def competitor_rate_features() -> List[pl.Expr]:
     ]
 
 
-def competitor_inv_features() -> List[pl.Expr]:
+def competitor_inv_features(packed: bool = False) -> List[pl.Expr]:
+    if packed:
+        return [
+            _popcount("comp_unavailable_mask").alias("num_competitor_unavailable"),
+            _popcount("comp_inv_valid_mask").alias("num_valid_comp_inv"),
+        ]
+
     comp_inv_cols = [f"comp{i}_inv" for i in range(1, 9)]
 
     return [
@@ -35,7 +57,17 @@ def competitor_inv_features() -> List[pl.Expr]:
     ]
 
 
-def competitor_price_diff_features() -> List[pl.Expr]:
+def competitor_price_diff_features(packed: bool = False) -> List[pl.Expr]:
+    if packed:
+        pct_diffs = pl.col("comp_price_pct_diff")
+        return [
+            pct_diffs.arr.to_list()
+            .list.mean()
+            .cast(pl.Float64)
+            .alias("mean_comp_price_diff_pct"),
+            pct_diffs.arr.max().cast(pl.Float64).alias("max_comp_price_diff_pct"),
+        ]
+
     comp_pct_cols = [f"comp{i}_rate_percent_diff" for i in range(1, 9)]
 
     return [
@@ -49,6 +81,7 @@ def competitor_price_diff_features() -> List[pl.Expr]:
 
 
 __all__ = [
+    "PACKED_COMPETITOR_MASK",
     "competitor_rate_features",
     "competitor_inv_features",
     "competitor_price_diff_features",
@@ -15,7 +15,7 @@ from features.imputation_module import (
     optimized_mean_imputation,
     optimized_median_imputation
 )
-from features.outlier_detection import apply_mad_outlier_filter
+from features.utils.feature_utils import mad_filter
 
 def build_feature_pipeline(df: pl.LazyFrame, debug: bool = True, filter_outliers: bool = True) -> pl.LazyFrame:
     if debug: print("🚧 Starting feature pipeline...")
@@ -29,7 +29,8 @@ def build_feature_pipeline(df: pl.LazyFrame, debug: bool = True, filter_outliers
             "prop_log_historical_price",
             "gross_bookings_usd"
         ]
-        df = apply_mad_outlier_filter(df, columns=usd_columns, threshold=3.0)
+        # One scan for the medians/MADs of all columns, filtered in place
+        df = mad_filter(df, usd_columns, z_thresh=3.0, output_suffix="")
 
     # 2. Imputation
     if debug: print("🔧 Imputing missing values...")
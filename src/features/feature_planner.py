@@ -0,0 +1,303 @@
+# src/features/feature_planner.py
+
+import polars as pl
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from hotel.hotel_entropy import (
+    bin_price_tier_expr,
+    hotel_entropy_features,
+    ENTROPY_DIMENSIONS,
+    ENTROPY_EVENTS,
+)
+from hotel.hotel_rolling_features import (
+    hotel_rolling_features,
+    hotel_rolling_stats,
+    ROLLING_WINDOWS,
+)
+from hotel.location_features import location_score_features
+from user.user_historical_features import (
+    user_history_flags,
+    user_vs_hotel_diff_features,
+)
+from booking.booking_features import booking_stats_features, query_level_flags
+from search.search_context_features import search_context_features
+from search.calendar_features import calendar_time_features, CALENDAR_FEATURES
+from search.query_relative_features import (
+    query_relative_features,
+    query_relative_feature_names,
+    QUERY_RELATIVE_FEATURES,
+)
+from competitor.competitor_features import (
+    competitor_inv_features,
+    competitor_rate_features,
+    competitor_price_diff_features,
+    PACKED_COMPETITOR_MASK,
+)
+from utils.load_yaml import load_yaml
+
+REGISTRY_PATH = (
+    Path(__file__).resolve().parents[2]
+    / "configs"
+    / "features"
+    / "feature_registry.yaml"
+)
+PLANNABLE_STATUSES = ("active", "experimental")
+
+# Features computed on the whole frame (joins), with their input columns.
+# Features sharing a function are computed by a single call.
+FRAME_FEATURES: Dict[str, Tuple[Callable[[pl.LazyFrame], pl.LazyFrame], List[str]]] = {
+    **{
+        f"{event}_entropy_{dim}": (
+            hotel_entropy_features,
+            [
+                "hotel_id",
+                *ENTROPY_EVENTS.values(),
+                *(
+                    c
+                    for expr, _ in ENTROPY_DIMENSIONS.values()
+                    for c in expr.meta.root_names()
+                ),
+            ],
+        )
+        for event in ENTROPY_EVENTS
+        for dim in ENTROPY_DIMENSIONS
+    },
+    **{
+        f"rolling_{stat}_{w}d": (
+            hotel_rolling_stats,
+            ["hotel_id", "display_price", "was_clicked", "search_timestamp"],
+        )
+        for stat in ("mean_price", "std_price", "click_rate")
+        for w in ROLLING_WINDOWS
+    },
+    **{
+        name: (
+            calendar_time_features,
+            [
+                "search_timestamp",
+                "days_until_checkin",
+                "user_country_id",
+                "hotel_country_id",
+            ],
+        )
+        for name in CALENDAR_FEATURES
+    },
+    **{
+        name: (
+            query_relative_features,
+            ["search_id", *QUERY_RELATIVE_FEATURES],
+        )
+        for name in query_relative_feature_names()
+    },
+}
+
+
+def expression_catalog(packed: bool = False) -> Dict[str, pl.Expr]:
+    """
+    Map every expression-based feature to the expression that computes it.
+
+    Parameters:
+    -----------
+    packed : bool
+        True if the competitor block is stored as bitmasks
+
+    Returns:
+    --------
+    Dict[str, pl.Expr]
+        Output column name -> expression
+    """
+    exprs = [
+        *hotel_rolling_features(window_size=7),
+        *location_score_features(),
+        *user_history_flags(),
+        *user_vs_hotel_diff_features(),
+        *booking_stats_features(),
+        *query_level_flags(),
+        *search_context_features(),
+        *competitor_inv_features(packed),
+        *competitor_rate_features(packed),
+        *competitor_price_diff_features(packed),
+        bin_price_tier_expr(),
+    ]
+    return {expr.meta.output_name(): expr for expr in exprs}
+
+
+class FeaturePlan:
+    """
+    Minimal computation for a set of requested features: the input columns
+    to project, the expressions grouped by dependency depth (each computed
+    exactly once), and the frame-level steps that run after them.
+    """
+
+    def __init__(
+        self,
+        outputs: List[str],
+        input_columns: List[str],
+        levels: List[List[pl.Expr]],
+        frame_steps: List[str],
+    ):
+        self.outputs = outputs
+        self.input_columns = input_columns
+        self.levels = levels
+        self.frame_steps = frame_steps
+
+    def apply(self, lf: pl.LazyFrame) -> pl.LazyFrame:
+        """Project the inputs, add the features and drop the intermediates."""
+        lf = lf.select(self.input_columns)
+        for exprs in self.levels:
+            lf = lf.with_columns(exprs)
+        for step in dict.fromkeys(FRAME_FEATURES[name][0] for name in self.frame_steps):
+            lf = step(lf)
+        return lf.select(self.outputs)
+
+    def __repr__(self) -> str:
+        n_exprs = sum(len(exprs) for exprs in self.levels)
+        return (
+            f"FeaturePlan({len(self.outputs)} outputs, "
+            f"{len(self.input_columns)} input columns, {n_exprs} expressions "
+            f"in {len(self.levels)} levels, frame steps: {self.frame_steps})"
+        )
+
+
+def _feature_dependencies(
+    name: str,
+    registry: Dict[str, dict],
+    catalog: Dict[str, pl.Expr],
+    wanted_by: Optional[str] = None,
+) -> List[str]:
+    """
+    Check that a feature missing from the input can be planned, and return
+    what it needs: the columns its expression (or frame step) reads and the
+    registry's `required_columns` that are features themselves.
+    """
+    if name not in catalog and name not in FRAME_FEATURES:
+        where = f" (needed by '{wanted_by}')" if wanted_by else ""
+        reason = "no expression computes it" if name in registry else "unknown"
+        raise ValueError(f"Cannot compute '{name}'{where}: {reason}")
+    entry = registry.get(name)
+    if entry is None:
+        raise ValueError(f"Feature '{name}' is not in the feature registry")
+    if entry.get("status") not in PLANNABLE_STATUSES:
+        raise ValueError(f"Feature '{name}' has status '{entry.get('status')}'")
+
+    required = entry.get("required_columns") or []
+    if name in catalog:
+        reads = catalog[name].meta.root_names()
+        if any(col in FRAME_FEATURES for col in required):
+            raise ValueError(f"'{name}' cannot depend on a frame-level feature")
+    else:
+        reads = FRAME_FEATURES[name][1]
+    feature_deps = [
+        col
+        for col in required
+        if col != name and (col in catalog or col in FRAME_FEATURES)
+    ]
+    return list(dict.fromkeys([*reads, *feature_deps]))
+
+
+def plan_features(
+    requested: List[str],
+    available_columns: List[str],
+    packed: bool = False,
+    registry: Optional[Dict[str, dict]] = None,
+) -> FeaturePlan:
+    """
+    Resolve the requested features into a `FeaturePlan`.
+
+    A requested name is taken as is if the input already has it; otherwise
+    it must be registered with a plannable status and have an expression
+    (or frame step) that computes it. Dependencies are the registry's
+    `required_columns` that are features themselves, plus the columns the
+    expression actually reads, resolved recursively.
+
+    Parameters:
+    -----------
+    requested : List[str]
+        Output columns, in order (features and pass-through columns)
+    available_columns : List[str]
+        Columns of the input LazyFrame
+    packed : bool
+        True if the competitor block is stored as bitmasks
+    registry : Dict[str, dict], optional
+        Feature registry; loaded from REGISTRY_PATH if not given
+
+    Returns:
+    --------
+    FeaturePlan
+    """
+    registry = load_yaml(REGISTRY_PATH) if registry is None else registry
+    catalog = expression_catalog(packed)
+    available = set(available_columns)
+
+    depth: Dict[str, int] = {}
+    input_columns: List[str] = []
+    frame_steps: List[str] = []
+    visiting = set()
+
+    def visit(name: str, wanted_by: Optional[str] = None) -> int:
+        if name in depth:
+            return depth[name]
+        if name in available:
+            input_columns.append(name)
+            depth[name] = 0
+            return 0
+        deps = _feature_dependencies(name, registry, catalog, wanted_by)
+        if name in visiting:
+            raise ValueError(f"Circular dependency through '{name}'")
+        visiting.add(name)
+        level = 1 + max((visit(dep, name) for dep in deps), default=0)
+
+        visiting.discard(name)
+        if name in FRAME_FEATURES:
+            frame_steps.append(name)
+        depth[name] = level
+        return level
+
+    outputs = list(dict.fromkeys(requested))
+    for name in outputs:
+        visit(name)
+
+    computed = [name for name in depth if name in catalog and depth[name] > 0]
+    n_levels = max((depth[name] for name in computed), default=0)
+    levels = [
+        [catalog[name] for name in computed if depth[name] == level]
+        for level in range(1, n_levels + 1)
+    ]
+    return FeaturePlan(
+        outputs, input_columns, [exprs for exprs in levels if exprs], frame_steps
+    )
+
+
+def build_planned_features(
+    lf: pl.LazyFrame,
+    features: List[str],
+    registry: Optional[Dict[str, dict]] = None,
+) -> pl.LazyFrame:
+    """
+    Compute only the requested features (plus their dependencies) and
+    return them as the only columns.
+
+    Parameters:
+    -----------
+    lf : pl.LazyFrame
+        Input LazyFrame with raw data
+    features : List[str]
+        Output columns, in order; include keys such as search_id here
+    registry : Dict[str, dict], optional
+        Feature registry; loaded from REGISTRY_PATH if not given
+
+    Returns:
+    --------
+    pl.LazyFrame
+        LazyFrame with exactly the requested columns
+    """
+    columns = lf.collect_schema().names()
+    plan = plan_features(
+        features,
+        columns,
+        packed=PACKED_COMPETITOR_MASK in columns,
+        registry=registry,
+    )
+    print(f"Planned features: {plan}")
+    return plan.apply(lf)
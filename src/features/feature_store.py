@@ -0,0 +1,262 @@
+# src/features/feature_store.py
+
+import hashlib
+import inspect
+import os
+import holidays
+import polars as pl
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from hotel.hotel_entropy import hotel_entropy_features
+from hotel.hotel_rolling_features import hotel_rolling_stats, ROLLING_WINDOWS
+from hotel.location_features import location_score_features
+from user.user_historical_features import (
+    user_history_flags,
+    user_vs_hotel_diff_features,
+)
+from booking.booking_features import booking_stats_features, query_level_flags
+from search.search_context_features import search_context_features
+from search.calendar_features import (
+    calendar_time_features,
+    CALENDAR_YEARS,
+    COUNTRY_CODES_PATH,
+)
+from search.query_relative_features import query_relative_features
+from competitor.competitor_features import (
+    competitor_inv_features,
+    competitor_rate_features,
+    competitor_price_diff_features,
+    PACKED_COMPETITOR_MASK,
+)
+from utils.feature_utils import standardize_expr
+
+from expedia_ranker.io.parquet_io import parquet_files
+from expedia_ranker.io.path_helpers import get_feature_file_path
+
+# Position of the impression in the input: the join key of every group
+ROW_KEY = "__row_index"
+
+
+def _packed(lf: pl.LazyFrame) -> bool:
+    return PACKED_COMPETITOR_MASK in lf.collect_schema().names()
+
+
+def _search_group(lf: pl.LazyFrame) -> pl.LazyFrame:
+    return calendar_time_features(lf).with_columns(
+        [
+            *search_context_features(),
+        ]
+    )
+
+
+def _hotel_group(lf: pl.LazyFrame) -> pl.LazyFrame:
+    return hotel_rolling_stats(lf, windows=ROLLING_WINDOWS).with_columns(
+        [
+            *location_score_features(),
+        ]
+    )
+
+
+def _user_group(lf: pl.LazyFrame) -> pl.LazyFrame:
+    return lf.with_columns(
+        [
+            *user_history_flags(),
+            *user_vs_hotel_diff_features(),
+        ]
+    )
+
+
+def _booking_group(lf: pl.LazyFrame) -> pl.LazyFrame:
+    return lf.with_columns(
+        [
+            *booking_stats_features(),
+            *query_level_flags(),
+        ]
+    )
+
+
+def _competitor_group(lf: pl.LazyFrame) -> pl.LazyFrame:
+    packed = _packed(lf)
+    return lf.with_columns(
+        [
+            *competitor_inv_features(packed),
+            *competitor_rate_features(packed),
+            *competitor_price_diff_features(packed),
+        ]
+    )
+
+
+# Feature group -> (function adding the group's columns, functions whose
+# modules hold the group's code: their source is part of the cache key)
+FEATURE_GROUPS: Dict[str, Tuple[Callable[[pl.LazyFrame], pl.LazyFrame], list]] = {
+    "search": (_search_group, [calendar_time_features, search_context_features]),
+    "hotel": (
+        _hotel_group,
+        [hotel_rolling_stats, location_score_features, standardize_expr],
+    ),
+    "user": (_user_group, [user_history_flags]),
+    "booking": (_booking_group, [booking_stats_features]),
+    "query": (query_relative_features, [query_relative_features]),
+    "competitor": (_competitor_group, [competitor_inv_features]),
+    "entropy": (hotel_entropy_features, [hotel_entropy_features]),
+}
+
+
+# Feature group -> what its code reads besides the input: config files
+# (hashed by content), and constants and library versions (hashed as text)
+GROUP_DEPENDENCIES: Dict[str, list] = {
+    "search": [
+        COUNTRY_CODES_PATH,
+        f"CALENDAR_YEARS={CALENDAR_YEARS!r}",
+        f"holidays=={holidays.__version__}",
+    ],
+}
+
+
+def _group_dependencies(group: str) -> bytes:
+    """Content of a group's config files, constants and library versions."""
+    parts = []
+    for dependency in GROUP_DEPENDENCIES.get(group, []):
+        if isinstance(dependency, Path):
+            content = dependency.read_bytes() if dependency.exists() else b""
+            parts.append(dependency.name.encode() + b":" + content)
+        else:
+            parts.append(dependency.encode())
+    return b"\0".join(parts)
+
+
+def _group_source(group: str) -> str:
+    """Source of a group's function and of every module its code lives in."""
+    compute, functions = FEATURE_GROUPS[group]
+    modules = {inspect.getmodule(fn) for fn in functions}
+    return inspect.getsource(compute) + "".join(
+        inspect.getsource(module)
+        for module in sorted(modules, key=lambda m: m.__name__)
+    )
+
+
+def dataset_fingerprint(path: Path) -> str:
+    """
+    Identify a Parquet file or dataset directory by the names, sizes and
+    modification times of its files (no data is read).
+    """
+    digest = hashlib.sha256()
+    for file in parquet_files(path):
+        stat = file.stat()
+        digest.update(
+            f"{file.relative_to(path.parent)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+        )
+    return digest.hexdigest()
+
+
+class FeatureStore:
+    """
+    Content-addressed cache of materialized feature groups.
+
+    Every group is stored as its own Parquet file holding ROW_KEY and the
+    group's columns, named with `get_feature_file_path(group, version)`
+    where the version hashes:
+    - the input dataset: a key given by the caller, which must also cover
+      upstream filters and imputation, and the input schema
+    - the group's code: the source of its function and of the modules
+      that define its expressions, so parameters (e.g. the rolling window)
+      and module constants (e.g. the calendar years) are covered. Polars
+      plans are not hashed: they do not serialize deterministically.
+    - what the group's code reads besides the input (GROUP_DEPENDENCIES):
+      config files such as the country codes, and library versions such
+      as the holiday calendars of `holidays`
+
+    A group whose key already exists is reused; only stale groups are
+    recomputed. Old versions are kept, so switching back is a hit too.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = root
+
+    def _path(self, group: str, version: str) -> Path:
+        path = get_feature_file_path(group, version)
+        return path if self.root is None else self.root / path.name
+
+    def group_version(self, lf: pl.LazyFrame, group: str, dataset_key: str) -> str:
+        """Return the content hash that names a group's materialization."""
+        schema = lf.collect_schema()
+        digest = hashlib.sha256()
+        digest.update(dataset_key.encode())
+        digest.update(repr(list(schema.items())).encode())
+        digest.update(group.encode())
+        digest.update(_group_source(group).encode())
+        digest.update(_group_dependencies(group))
+        return digest.hexdigest()[:16]
+
+    def materialize(
+        self,
+        lf: pl.LazyFrame,
+        dataset_key: str,
+        groups: Optional[List[str]] = None,
+    ) -> Dict[str, Path]:
+        """
+        Make sure every requested group is materialized for this input and
+        return the Parquet path of each one.
+
+        Parameters:
+        -----------
+        lf : pl.LazyFrame
+            Input LazyFrame with raw data, in a deterministic row order
+        dataset_key : str
+            Identity of the input data and of any transform applied to it,
+            e.g. `dataset_fingerprint(path)` plus the preprocessing options
+        groups : List[str], optional
+            Feature groups to materialize (default: all of FEATURE_GROUPS)
+
+        Returns:
+        --------
+        Dict[str, Path]
+            Group name -> materialized Parquet file
+        """
+        input_columns = lf.collect_schema().names()
+        paths = {}
+        for group in groups or list(FEATURE_GROUPS):
+            path = self._path(group, self.group_version(lf, group, dataset_key))
+            if path.exists():
+                print(f"[store] {group}: cached ({path.name})")
+            else:
+                print(f"[store] {group}: building ({path.name})...")
+                group_lf = FEATURE_GROUPS[group][0](lf.with_row_index(ROW_KEY))
+                new_columns = [
+                    c
+                    for c in group_lf.collect_schema().names()
+                    if c not in input_columns and c != ROW_KEY
+                ]
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(".tmp")
+                group_lf.select([ROW_KEY, *new_columns]).collect().write_parquet(
+                    tmp_path
+                )
+                os.replace(tmp_path, path)
+            paths[group] = path
+        return paths
+
+    def assemble(
+        self,
+        lf: pl.LazyFrame,
+        dataset_key: str,
+        groups: Optional[List[str]] = None,
+    ) -> pl.LazyFrame:
+        """
+        Build (or reuse) the groups and join them to the input on ROW_KEY.
+        The group files are scanned lazily, so only the feature columns a
+        query selects are read.
+
+        Returns:
+        --------
+        pl.LazyFrame
+            Input columns plus the columns of every group
+        """
+        paths = self.materialize(lf, dataset_key, groups)
+        lf = lf.with_row_index(ROW_KEY)
+        for path in paths.values():
+            lf = lf.join(
+                pl.scan_parquet(path), on=ROW_KEY, how="left", maintain_order="left"
+            )
+        return lf.drop(ROW_KEY)
@@ -1,5 +1,5 @@
 import polars as pl
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 
 def bin_price_tier_expr(
@@ -23,6 +23,115 @@ def bin_price_tier_expr(
     )
 
 
+def _price_tier_code(
+    price_col: str = "display_price", thresholds: Tuple[int, int] = (100, 300)
+) -> pl.Expr:
+    """Price tier as 0/1/2, like `bin_price_tier_expr` (nulls fall in the top tier)."""
+    low, high = thresholds
+    return (
+        pl.when(pl.col(price_col) < low)
+        .then(0)
+        .when(pl.col(price_col) < high)
+        .then(1)
+        .otherwise(2)
+    )
+
+
+def band_expr(col: str, edges: List[float]) -> pl.Expr:
+    """
+    Band code of a numeric column: the number of edges at or below the
+    value (so len(edges) + 1 bands). Nulls stay null and are not counted.
+    """
+    return pl.sum_horizontal([(pl.col(col) >= edge).cast(pl.UInt8) for edge in edges])
+
+
+# Dimension -> (expression giving a band code in [0, n_bands), n_bands)
+ENTROPY_DIMENSIONS: Dict[str, Tuple[pl.Expr, int]] = {
+    "price_tier": (_price_tier_code(), 3),
+    "star_bucket": (band_expr("hotel_star_rating", [1, 2, 3, 4, 5]), 6),
+    "days_until_checkin_bucket": (band_expr("days_until_checkin", [3, 14]), 3),
+    "position_band": (band_expr("display_position", [6, 11, 21]), 4),
+}
+
+# Event name -> 0/1 column whose distribution over the bands is measured
+ENTROPY_EVENTS: Dict[str, str] = {"click": "was_clicked", "booking": "was_booked"}
+
+
+def hotel_entropy_table(
+    lf: pl.LazyFrame,
+    dimensions: Optional[Dict[str, Tuple[pl.Expr, int]]] = None,
+    events: Optional[Dict[str, str]] = None,
+    hotel_id_col: str = "hotel_id",
+) -> pl.LazyFrame:
+    """
+    Compute the entropy (in bits) of each hotel's events across the bands
+    of every dimension, as `{event}_entropy_{dimension}` columns with one
+    row per hotel that has an event.
+    - Rows without any event are dropped first
+    - Every (event, dimension, band) indicator becomes a plain column, so
+      one group_by on hotel_id counts them all with fast-path sums
+    - Entropies are computed on the per-hotel counts
+
+    A new dimension only adds a few sums to the same aggregation.
+    Hotels without any event get null. Rows with a null band code are
+    left out of that dimension.
+    """
+    dimensions = ENTROPY_DIMENSIONS if dimensions is None else dimensions
+    events = ENTROPY_EVENTS if events is None else events
+
+    # Only rows with an event carry counts; other hotels get null anyway
+    any_event = pl.any_horizontal([pl.col(col) > 0 for col in events.values()])
+    cells = {
+        (e, dim, band): f"__{e}_{dim}_{band}"
+        for e in events
+        for dim, (_, n_bands) in dimensions.items()
+        for band in range(n_bands)
+    }
+    bands = {dim: expr for dim, (expr, _) in dimensions.items()}
+    counts = (
+        lf.filter(any_event)
+        .with_columns(
+            # Plain columns, so the group_by below runs fast-path sums
+            ((pl.col(events[e]) > 0) & (bands[dim] == band))
+            .fill_null(False)
+            .cast(pl.UInt32)
+            .alias(name)
+            for (e, dim, band), name in cells.items()
+        )
+        .group_by(hotel_id_col)
+        .agg(pl.col(name).sum() for name in cells.values())
+    )
+
+    entropy_exprs = []
+    for e in events:
+        for dim, (_, n_bands) in dimensions.items():
+            row = [pl.col(cells[(e, dim, band)]) for band in range(n_bands)]
+            total = pl.sum_horizontal(row)
+            terms = [
+                pl.when(cell > 0).then(cell / total * (cell / total).log(base=2))
+                for cell in row
+            ]
+            entropy_exprs.append(
+                pl.when(total > 0)
+                .then(-pl.sum_horizontal(terms))
+                .alias(f"{e}_entropy_{dim}")
+            )
+    return counts.select(hotel_id_col, *entropy_exprs)
+
+
+def hotel_entropy_features(
+    lf: pl.LazyFrame,
+    dimensions: Optional[Dict[str, Tuple[pl.Expr, int]]] = None,
+    events: Optional[Dict[str, str]] = None,
+    hotel_id_col: str = "hotel_id",
+) -> pl.LazyFrame:
+    """
+    Add the `hotel_entropy_table` columns to every impression with one join.
+    """
+    entropies = hotel_entropy_table(lf, dimensions, events, hotel_id_col)
+    return lf.join(entropies, on=hotel_id_col, how="left", maintain_order="left")
+
+
 def hotel_click_entropy_price_tier(
     lf: pl.LazyFrame,
     thresholds: Tuple[int, int] = (100, 300),
@@ -33,41 +142,13 @@ def hotel_click_entropy_price_tier(
 ) -> pl.LazyFrame:
     """
     Add click entropy across price tiers to a LazyFrame.
-    - Bins prices into tiers
-    - Filters to clicked rows
-    - Computes entropy per hotel
+    - Bins prices into tiers (kept as the price_tier column)
+    - Computes entropy per hotel with `hotel_entropy_features`
     """
-    # 1. Add price tier column
     lf = lf.with_columns([bin_price_tier_expr(price_col, thresholds, labels)])
-
-    # 2. Filter only clicked rows
-    clicked = lf.filter(pl.col(click_col) == 1)
-
-    # 3. Count clicks per hotel and price tier
-    counts = clicked.group_by([hotel_id_col, "price_tier"]).agg(
-        pl.count().alias("tier_click_count")
-    )
-
-    # 4. Compute total clicks per hotel
-    totals = counts.group_by(hotel_id_col).agg(
-        pl.sum("tier_click_count").alias("total_clicks")
-    )
-
-    # 5. Join and compute entropy components
-    entropy_components = (
-        counts.join(totals, on=hotel_id_col)
-        .with_columns(
-            [
-                (pl.col("tier_click_count") / pl.col("total_clicks")).alias("p"),
-                (pl.col("tier_click_count") / pl.col("total_clicks"))
-                .log(base=2)
-                .alias("log_p"),
-            ]
-        )
-        .with_columns([(-pl.col("p") * pl.col("log_p")).alias("entropy_component")])
-        .group_by(hotel_id_col)
-        .agg(pl.sum("entropy_component").alias("click_entropy_price_tier"))
+    return hotel_entropy_features(
+        lf,
+        dimensions={"price_tier": (_price_tier_code(price_col, thresholds), 3)},
+        events={"click": click_col},
+        hotel_id_col=hotel_id_col,
     )
-
-    # 6. Join entropy values back to original LazyFrame
-    return lf.join(entropy_components, on=hotel_id_col, how="left")
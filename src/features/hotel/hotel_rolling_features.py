@@ -1,5 +1,5 @@
 import polars as pl
-from typing import List
+from typing import List, Tuple
 
 
 def hotel_rolling_features(window_size: int = 7) -> List[pl.Expr]:
@@ -21,3 +21,183 @@ def hotel_rolling_features(window_size: int = 7) -> List[pl.Expr]:
         .over("hotel_id")
         .alias("rolling_click_rate"),
     ]
+
+
+ROLLING_WINDOWS = (1, 7, 30, 90)
+# Days left out before every window: 1 keeps the current day (and so the
+# impression's own click) out of its features
+ROLLING_LAG_DAYS = 1
+
+# Additive per-(hotel, day) aggregates the windows are built from
+_DAILY_SUMS = ["price_sum", "price_sq_sum", "price_count", "click_sum", "click_count"]
+
+
+def hotel_daily_aggregates(
+    lf: pl.LazyFrame,
+    price_col: str = "display_price",
+    click_col: str = "was_clicked",
+    hotel_id_col: str = "hotel_id",
+    timestamp_col: str = "search_timestamp",
+) -> pl.LazyFrame:
+    """
+    Reduce impressions to one row per (hotel, search day) with the sums,
+    sums of squares and non-null counts that rolling statistics need.
+    Price moments are centered on the hotel's overall mean price, so the
+    cumulative sums in `hotel_rolling_stats` keep their precision.
+    """
+    price = pl.col(price_col).cast(pl.Float64)
+    daily = lf.group_by(
+        hotel_id_col, pl.col(timestamp_col).dt.date().alias("search_date")
+    ).agg(
+        price.sum().alias("price_sum"),
+        (price**2).sum().alias("price_sq_sum"),
+        price.count().cast(pl.Float64).alias("price_count"),
+        pl.col(click_col).cast(pl.Float64).sum().alias("click_sum"),
+        pl.col(click_col).count().cast(pl.Float64).alias("click_count"),
+    )
+    center = (
+        pl.col("price_sum").sum().over(hotel_id_col)
+        / pl.col("price_count").sum().over(hotel_id_col)
+    ).fill_nan(0.0)
+    return daily.with_columns(
+        (
+            pl.col("price_sq_sum")
+            - 2 * center * pl.col("price_sum")
+            + pl.col("price_count") * center**2
+        ).alias("price_sq_sum"),
+        (pl.col("price_sum") - pl.col("price_count") * center).alias("price_sum"),
+        center.alias("price_center"),
+    )
+
+
+def hotel_rolling_table(
+    lf: pl.LazyFrame,
+    windows: Tuple[int, ...] = ROLLING_WINDOWS,
+    lag_days: int = ROLLING_LAG_DAYS,
+    price_col: str = "display_price",
+    click_col: str = "was_clicked",
+    hotel_id_col: str = "hotel_id",
+    timestamp_col: str = "search_timestamp",
+) -> pl.LazyFrame:
+    """
+    Compute rolling price mean/std and click rate per hotel for several
+    windows of days, as one row per (hotel, search day), from daily
+    aggregates instead of impressions.
+
+    - Impressions are reduced to (hotel, day) sums once
+    - Per-hotel cumulative sums are taken in one pass over the days,
+      sorted once
+    - Each window is the difference of two cumulative sums, looked up
+      with one as-of join on the hotel-days
+
+    Windows are whole calendar days, not timestamp ranges: the window of
+    size w for day d covers the days (d - lag - w, d - lag], the same for
+    every impression of day d. Unlike the (t - w days, t] windows of
+    `hotel_rolling_features`, `lag_days=0` would include the whole current
+    day, later impressions and their clicks too; the default
+    ROLLING_LAG_DAYS=1 excludes it. Cost scales with hotel-days, not
+    impressions.
+
+    Holds rolling_mean_price_{w}d, rolling_std_price_{w}d and
+    rolling_click_rate_{w}d for every window w, keyed by hotel_id_col and
+    search_date.
+    """
+    daily = hotel_daily_aggregates(
+        lf, price_col, click_col, hotel_id_col, timestamp_col
+    ).sort("search_date")
+    cumulative = daily.select(
+        hotel_id_col,
+        "search_date",
+        "price_center",
+        *[
+            pl.col(c).cum_sum().over(hotel_id_col).alias(f"{c}_cum")
+            for c in _DAILY_SUMS
+        ],
+    )
+    cum_cols = [f"{c}_cum" for c in _DAILY_SUMS]
+
+    def cumulative_at(offset: int, suffix: str) -> pl.LazyFrame:
+        """Cumulative sums at the last hotel-day on or before day - offset."""
+        probe = cumulative.select(
+            hotel_id_col,
+            "search_date",
+            (pl.col("search_date") - pl.duration(days=offset)).alias("__probe"),
+        )
+        return probe.join_asof(
+            cumulative.select(
+                hotel_id_col,
+                pl.col("search_date").alias("__probe"),
+                *[pl.col(c).alias(f"{c}{suffix}") for c in cum_cols],
+            ),
+            on="__probe",
+            by=hotel_id_col,
+            strategy="backward",
+        ).drop("__probe")
+
+    keys = [hotel_id_col, "search_date"]
+    stats = cumulative.select(*keys, "price_center")
+    stats = stats.join(cumulative_at(lag_days, "_end"), on=keys)
+    exprs = []
+    for w in windows:
+        stats = stats.join(cumulative_at(lag_days + w, f"_{w}d"), on=keys)
+        total = {
+            c: pl.col(f"{c}_cum_end").fill_null(0)
+            - pl.col(f"{c}_cum_{w}d").fill_null(0)
+            for c in _DAILY_SUMS
+        }
+        n = total["price_count"]
+        exprs += [
+            pl.when(n > 0)
+            .then(total["price_sum"] / n + pl.col("price_center"))
+            .alias(f"rolling_mean_price_{w}d"),
+            pl.when(n > 1)
+            .then(
+                ((total["price_sq_sum"] - total["price_sum"] ** 2 / n) / (n - 1))
+                .clip(0.0, None)
+                .sqrt()
+            )
+            .alias(f"rolling_std_price_{w}d"),
+            pl.when(total["click_count"] > 0)
+            .then(total["click_sum"] / total["click_count"])
+            .alias(f"rolling_click_rate_{w}d"),
+        ]
+    return stats.select(*keys, *exprs)
+
+
+def join_hotel_rolling(
+    lf: pl.LazyFrame,
+    stats: pl.LazyFrame,
+    hotel_id_col: str = "hotel_id",
+    timestamp_col: str = "search_timestamp",
+) -> pl.LazyFrame:
+    """
+    Join a `hotel_rolling_table` to the impressions on (hotel, search day).
+    """
+    return (
+        lf.with_columns(pl.col(timestamp_col).dt.date().alias("__search_date"))
+        .join(
+            stats.rename({"search_date": "__search_date"}),
+            on=[hotel_id_col, "__search_date"],
+            how="left",
+            maintain_order="left",
+        )
+        .drop("__search_date")
+    )
+
+
+def hotel_rolling_stats(
+    lf: pl.LazyFrame,
+    windows: Tuple[int, ...] = ROLLING_WINDOWS,
+    lag_days: int = ROLLING_LAG_DAYS,
+    price_col: str = "display_price",
+    click_col: str = "was_clicked",
+    hotel_id_col: str = "hotel_id",
+    timestamp_col: str = "search_timestamp",
+) -> pl.LazyFrame:
+    """
+    Add the `hotel_rolling_table` columns to every impression.
+    """
+    stats = hotel_rolling_table(
+        lf, windows, lag_days, price_col, click_col, hotel_id_col, timestamp_col
+    )
+    return join_hotel_rolling(lf, stats, hotel_id_col, timestamp_col)
@@ -1,30 +1,50 @@
 import polars as pl
-from typing import List
+from typing import Dict, List, Optional
 from utils.feature_utils import standardize_expr, normalize_expr
 
+LOCATION_SCORE_COLUMNS = ["location_score_primary", "location_score_secondary"]
 
-def location_score_features() -> List[pl.Expr]:
+
+def location_score_stats(lf: pl.LazyFrame) -> Dict[str, float]:
+    """
+    Min, max, mean and std of the location scores over the whole frame,
+    computed in one scan, as `{col}_{stat}` entries.
+    """
+    return (
+        lf.select(
+            getattr(pl.col(col), stat)().cast(pl.Float64).alias(f"{col}_{stat}")
+            for col in LOCATION_SCORE_COLUMNS
+            for stat in ("min", "max", "mean", "std")
+        )
+        .collect()
+        .row(0, named=True)
+    )
+
+
+def location_score_features(stats: Optional[Dict[str, float]] = None) -> List[pl.Expr]:
     """
     Return a list of location-based feature expressions for hotels.
+    With `stats` (see `location_score_stats`), the scalings use these
+    precomputed values instead of the frame's own.
     """
+    stats = stats or {}
+
+    def norm(col: str) -> pl.Expr:
+        return normalize_expr(col, stats.get(f"{col}_min"), stats.get(f"{col}_max"))
+
+    def zscore(col: str) -> pl.Expr:
+        return standardize_expr(col, stats.get(f"{col}_mean"), stats.get(f"{col}_std"))
+
     return [
-        normalize_expr("location_score_primary"),
-        normalize_expr("location_score_secondary"),
-        (
-            (
-                normalize_expr("location_score_primary")
-                + normalize_expr("location_score_secondary")
-            )
-            / 2
-        ).alias("location_score_mean_norm"),
-        standardize_expr("location_score_primary"),
-        standardize_expr("location_score_secondary"),
+        norm("location_score_primary"),
+        norm("location_score_secondary"),
+        ((norm("location_score_primary") + norm("location_score_secondary")) / 2).alias(
+            "location_score_mean_norm"
+        ),
+        zscore("location_score_primary"),
+        zscore("location_score_secondary"),
         (
-            (
-                standardize_expr("location_score_primary")
-                + standardize_expr("location_score_secondary")
-            )
-            / 2
+            (zscore("location_score_primary") + zscore("location_score_secondary")) / 2
         ).alias("location_score_mean_std"),
         (pl.col("location_score_primary") - pl.col("location_score_secondary")).alias(
             "location_score_diff"
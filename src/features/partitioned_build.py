@@ -0,0 +1,383 @@
+# src/features/partitioned_build.py
+
+import math
+import shutil
+import time
+import polars as pl
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from concurrent.futures import as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from hotel.hotel_entropy import hotel_entropy_table
+from hotel.hotel_rolling_features import (
+    hotel_rolling_table,
+    join_hotel_rolling,
+    ROLLING_WINDOWS,
+)
+from hotel.location_features import location_score_features, location_score_stats
+from user.user_historical_features import (
+    user_history_flags,
+    user_vs_hotel_diff_features,
+)
+from booking.booking_features import hotel_booking_stats_table, query_level_flags
+from search.calendar_features import calendar_time_features
+from search.query_relative_features import query_relative_features
+from search.search_context_features import search_context_features
+from competitor.competitor_features import (
+    competitor_inv_features,
+    competitor_rate_features,
+    competitor_price_diff_features,
+    PACKED_COMPETITOR_MASK,
+)
+from utils.feature_utils import mad_filter_expr
+from utils.interim_schema import interim_to_features
+from utils.robust_stats import robust_stats
+
+from expedia_ranker.data_pipeline.preprocessing.partitioning import (
+    search_bucket_expr,
+)
+from expedia_ranker.io.parquet_io import (
+    VIRTUAL_COLUMNS_KEY,
+    parquet_files,
+    scan_dataset,
+)
+from expedia_ranker.utilities.workers import polars_process_pool
+
+PARTITION_COLUMN = "search_bucket"
+DEFAULT_MEMORY_BUDGET_MB = 12_000  # leaves headroom on a 16 GB machine
+# In-memory size of a partition's features relative to its decoded input
+FEATURE_EXPANSION = 4
+# Staging directories inside the output ("_" hides them from scan_dataset)
+_PARTITIONS_DIR = "_partitions"
+_TABLES_DIR = "_hotel_tables"
+_IMPUTE_MEAN = "__impute_mean"
+
+
+def plan_partition_count(source: Path, memory_budget_mb: int, workers: int) -> int:
+    """
+    Number of search_id partitions such that every worker's partition,
+    decoded and with its features, fits in its share of the memory budget.
+    The decoded size is read from the Parquet footers. At least two
+    partitions per worker, so a slow partition does not idle the pool.
+    """
+    decoded_bytes = 0
+    for file in parquet_files(source):
+        metadata = pq.read_metadata(file)
+        decoded_bytes += sum(
+            metadata.row_group(rg).total_byte_size
+            for rg in range(metadata.num_row_groups)
+        )
+    worker_bytes = memory_budget_mb * 1024**2 / workers
+    return max(2 * workers, math.ceil(decoded_bytes * FEATURE_EXPANSION / worker_bytes))
+
+
+def scan_features_input(path: Path) -> pl.LazyFrame:
+    """
+    Scan interim data (a file, dataset or partition) under the feature
+    names and dtypes: preprocess writes its own names and Enum IDs.
+    """
+    return interim_to_features(scan_dataset(path))
+
+
+def spill_partitions(source: Path, partitions_dir: Path, n_partitions: int) -> None:
+    """
+    Stream the impressions into `partitions_dir/search_bucket=<b>/`, one
+    directory per search_id bucket, batch by batch (bounded memory). Every
+    impression of a search lands in the same partition. Virtual columns
+    stay virtual: the footer spec is copied to every partition file.
+    """
+    if partitions_dir.exists():
+        shutil.rmtree(partitions_dir)
+    files = parquet_files(source)
+    dataset = ds.dataset(
+        [str(file) for file in files],
+        format="parquet",
+        partitioning="hive" if source.is_dir() else None,
+        partition_base_dir=str(source) if source.is_dir() else None,
+    )
+    # Round-trip through Polars: it reads back only its own Enum layout
+    tables = (
+        pl.from_arrow(batch).with_columns(search_bucket_expr(n_partitions)).to_arrow()
+        for batch in dataset.to_batches(batch_size=65_536)
+    )
+    first = next(tables)
+    spec = (pq.read_schema(files[0]).metadata or {}).get(VIRTUAL_COLUMNS_KEY)
+    schema = first.schema
+    if spec:
+        schema = schema.with_metadata(
+            {**(schema.metadata or {}), VIRTUAL_COLUMNS_KEY: spec}
+        )
+
+    def batches():
+        yield from first.cast(schema).to_batches()
+        for table in tables:
+            yield from table.cast(schema).to_batches()
+
+    ds.write_dataset(
+        batches(),
+        partitions_dir,
+        schema=schema,
+        format="parquet",
+        partitioning=[PARTITION_COLUMN],
+        partitioning_flavor="hive",
+        basename_template="part-{i}.parquet",
+        max_rows_per_group=65_536,
+    )
+
+
+def build_hotel_tables(
+    lf: pl.LazyFrame,
+    tables_dir: Path,
+    mad_column: Optional[str] = "display_price",
+    z_thresh: float = 3.5,
+    impute_by: Optional[List[str]] = None,
+) -> Dict[str, object]:
+    """
+    Compute everything that needs the whole dataset, once: the hotel-level
+    tables (rolling stats per hotel-day, booking stats and entropies per
+    hotel, group means for the imputation) are written to `tables_dir`,
+    and the scalars (median/MAD, location score scalings) are returned.
+
+    Returns:
+    --------
+    Dict[str, object]
+        Constants for `partition_features` and the preprocessing
+    """
+    constants: Dict[str, object] = {"location": location_score_stats(lf)}
+    if mad_column:
+        median, mad = robust_stats(lf, [mad_column])[mad_column]
+        constants["mad"] = (median, mad)
+        lf = lf.with_columns(mad_filter_expr(mad_column, median, mad, z_thresh))
+
+    tables = {
+        "rolling": hotel_rolling_table(lf, windows=ROLLING_WINDOWS),
+        "booking": hotel_booking_stats_table(lf),
+        "entropy": hotel_entropy_table(lf),
+    }
+    if mad_column and impute_by:
+        tables["impute"] = lf.group_by(impute_by).agg(
+            pl.col(f"{mad_column}_mad_filtered").mean().alias(_IMPUTE_MEAN)
+        )
+
+    tables_dir.mkdir(parents=True, exist_ok=True)
+    for name, df in zip(tables, pl.collect_all(list(tables.values()))):
+        df.write_parquet(tables_dir / f"{name}.parquet")
+        print(f"[partitioned] {name} table: {df.height:,} rows")
+    return constants
+
+
+def partition_features(
+    lf: pl.LazyFrame, tables_dir: Path, constants: Dict[str, object]
+) -> pl.LazyFrame:
+    """
+    The steps of `build_features` on one search_id partition: row-level
+    and per-query features are computed locally, hotel-level features are
+    broadcast-joined from the tables of `build_hotel_tables`.
+    """
+    lf = calendar_time_features(lf)
+    lf = join_hotel_rolling(lf, pl.scan_parquet(tables_dir / "rolling.parquet"))
+    lf = lf.with_columns(
+        [
+            *location_score_features(constants["location"]),
+            *user_history_flags(),
+            *user_vs_hotel_diff_features(),
+        ]
+    )
+    lf = lf.join(
+        pl.scan_parquet(tables_dir / "booking.parquet"),
+        on="hotel_id",
+        how="left",
+        maintain_order="left",
+    )
+    lf = lf.with_columns(query_level_flags())
+    lf = query_relative_features(lf)
+    lf = lf.with_columns(search_context_features())
+    packed = PACKED_COMPETITOR_MASK in lf.collect_schema().names()
+    lf = lf.with_columns(
+        [
+            *competitor_inv_features(packed),
+            *competitor_rate_features(packed),
+            *competitor_price_diff_features(packed),
+        ]
+    )
+    return lf.join(
+        pl.scan_parquet(tables_dir / "entropy.parquet"),
+        on="hotel_id",
+        how="left",
+        maintain_order="left",
+    )
+
+
+def _build_partition(
+    partition_dir: Path,
+    output_file: Path,
+    tables_dir: Path,
+    constants: Dict[str, object],
+    mad_column: Optional[str],
+    z_thresh: float,
+    impute_by: Optional[List[str]],
+) -> dict:
+    """Preprocess one partition, build its features and write them."""
+    start = time.perf_counter()
+    lf = scan_features_input(partition_dir)
+    if mad_column:
+        lf = lf.with_columns(mad_filter_expr(mad_column, *constants["mad"], z_thresh))
+        if impute_by:
+            imputed = f"{mad_column}_mad_filtered"
+            lf = (
+                lf.join(
+                    pl.scan_parquet(tables_dir / "impute.parquet"),
+                    on=impute_by,
+                    how="left",
+                    maintain_order="left",
+                )
+                .with_columns(
+                    pl.col(imputed)
+                    .fill_null(pl.col(_IMPUTE_MEAN))
+                    .alias(f"{imputed}_mean_imputed")
+                )
+                .drop(_IMPUTE_MEAN)
+            )
+    df = partition_features(lf, tables_dir, constants).collect()
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    df.write_parquet(output_file)
+    return {
+        "partition": partition_dir.name,
+        "rows": df.height,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def build_features_partitioned(
+    source: Path,
+    output_dir: Path,
+    n_partitions: Optional[int] = None,
+    workers: int = 1,
+    memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB,
+    mad_column: Optional[str] = "display_price",
+    z_thresh: float = 3.5,
+    impute_by: Optional[List[str]] = None,
+) -> Path:
+    """
+    Build the features of a whole dataset in bounded memory.
+
+    `build_features` needs windows over hotel_id and search_id, so its plan
+    cannot stream. Here:
+    1. The impressions are split into search_id-hash partitions (skipped
+       if the source is already partitioned by search_bucket)
+    2. Hotel-level tables and global scalars are computed once, on the
+       few columns they read
+    3. Every partition is built in a worker pool, joining the hotel tables,
+       and written as `output_dir/search_bucket=<b>/part-0.parquet`
+
+    Partitions and the source are read with `scan_features_input`, so the
+    interim files written by `preprocess` get the feature names and dtypes.
+
+    Parameters:
+    -----------
+    source : Path
+        Interim Parquet file or dataset directory
+    output_dir : Path
+        Output dataset directory (read it back with `scan_dataset`)
+    n_partitions : int, optional
+        Number of partitions; derived from the memory budget if not given
+    workers : int
+        Partitions built in parallel (one process each)
+    memory_budget_mb : int
+        Memory shared by the workers, in MB
+    mad_column : str, optional
+        Column to MAD-filter first, as in the `build_features` test block
+    z_thresh : float
+        Threshold of the MAD filter
+    impute_by : List[str], optional
+        Group columns for the mean imputation of the filtered column
+        (default: hotel_id)
+
+    Returns:
+    --------
+    Path
+        The output dataset directory
+    """
+    impute_by = ["hotel_id"] if impute_by is None else impute_by
+    start = time.perf_counter()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for stale in output_dir.glob(f"{PARTITION_COLUMN}=*"):
+        shutil.rmtree(stale)
+
+    # === 1. Partitions ===
+    partitions = sorted(source.glob(f"{PARTITION_COLUMN}=*")) if source.is_dir() else []
+    spilled = not partitions
+    if spilled:
+        n_partitions = n_partitions or plan_partition_count(
+            source, memory_budget_mb, workers
+        )
+        print(
+            f"[partitioned] Splitting {source.name} into {n_partitions} partitions..."
+        )
+        spill_partitions(source, output_dir / _PARTITIONS_DIR, n_partitions)
+        partitions = sorted(
+            (output_dir / _PARTITIONS_DIR).glob(f"{PARTITION_COLUMN}=*")
+        )
+    else:
+        print(f"[partitioned] Using the {len(partitions)} partitions of {source.name}")
+
+    # === 2. Hotel-level tables (global) ===
+    print("[partitioned] Computing hotel-level tables...")
+    tables_dir = output_dir / _TABLES_DIR
+    constants = build_hotel_tables(
+        scan_features_input(source), tables_dir, mad_column, z_thresh, impute_by
+    )
+
+    # === 3. Partition builds ===
+    workers = min(workers, len(partitions)) or 1
+    jobs = [
+        (
+            partition,
+            output_dir / partition.name / "part-0.parquet",
+            tables_dir,
+            constants,
+            mad_column,
+            z_thresh,
+            impute_by,
+        )
+        for partition in partitions
+    ]
+    print(f"[partitioned] Building {len(jobs)} partitions with {workers} workers...")
+    if workers == 1:
+        results = [_build_partition(*job) for job in jobs]
+    else:
+        with polars_process_pool(workers) as executor:
+            futures = [executor.submit(_build_partition, *job) for job in jobs]
+            results = [future.result() for future in as_completed(futures)]
+
+    for r in sorted(results, key=lambda r: r["partition"]):
+        print(f"  {r['partition']:<20} {r['rows']:>12,} rows {r['seconds']:>8.2f}s")
+
+    shutil.rmtree(tables_dir)
+    if spilled:
+        shutil.rmtree(output_dir / _PARTITIONS_DIR)
+    total = sum(r["rows"] for r in results)
+    print(
+        f"[partitioned] {total:,} rows in {time.perf_counter() - start:.1f}s "
+        f"-> {output_dir}"
+    )
+    return output_dir
+
+
+# ==========================
+# Full build of the interim dataset
+# ==========================
+if __name__ == "__main__":
+    # === CONFIG ===
+    DATA_DIR = Path("data")
+    INTERIM_PATH = DATA_DIR / "interim" / "train.parquet"
+    OUTPUT_DIR = DATA_DIR / "processed" / "features"
+    WORKERS = 2
+    MEMORY_BUDGET_MB = DEFAULT_MEMORY_BUDGET_MB
+
+    build_features_partitioned(
+        INTERIM_PATH, OUTPUT_DIR, workers=WORKERS, memory_budget_mb=MEMORY_BUDGET_MB
+    )
+    print(f"[✓] Read back with scan_dataset({OUTPUT_DIR})")
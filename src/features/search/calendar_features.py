@@ -0,0 +1,290 @@
+import polars as pl
+from datetime import date
+from pathlib import Path
+from typing import Dict, Optional
+import holidays
+
+from utils.load_yaml import load_yaml
+
+# Years covered by the calendar: searches are 2012-2013, check-ins run up to
+# ~500 days later. Dates outside the range get null calendar columns.
+CALENDAR_YEARS = range(2012, 2016)
+
+# Columns added by `calendar_time_features`
+CALENDAR_FEATURES = [
+    "search_hour",
+    "search_date",
+    "search_time_of_day",
+    "search_day_of_week",
+    "search_week",
+    "search_month",
+    "search_year",
+    "is_weekend_search",
+    "search_timestamp_is_holiday",
+    "search_days_to_holiday",
+    "expected_checkin_date",
+    "checkin_day_of_week",
+    "checkin_day_of_month",
+    "checkin_month",
+    "checkin_is_weekend",
+    "expected_checkin_date_is_holiday",
+    "checkin_days_to_holiday",
+]
+
+
+COUNTRY_CODES_PATH = (
+    Path(__file__).resolve().parents[3] / "configs" / "features" / "country_codes.yaml"
+)
+
+
+def load_country_codes(path: Path = COUNTRY_CODES_PATH) -> Dict[int, str]:
+    """
+    Load the country ID -> ISO code mapping used for holiday lookups.
+    """
+    return {int(k): str(v) for k, v in (load_yaml(path) or {}).items()}
+
+
+def build_calendar(years: range = CALENDAR_YEARS) -> pl.DataFrame:
+    """
+    One row per day with the date parts used as features.
+
+    Parameters:
+    -----------
+    years : range
+        Calendar years to cover
+
+    Returns:
+    --------
+    pl.DataFrame
+        date, day_of_week (Polars weekday: 1=Monday ... 7=Sunday), week,
+        month, year, day_of_month, is_weekend (1 on Friday and Saturday,
+        the weekend convention of `search_temporal_features`)
+    """
+    dates = pl.date_range(
+        date(years[0], 1, 1), date(years[-1], 12, 31), "1d", eager=True
+    ).alias("date")
+    return pl.DataFrame(dates).with_columns(
+        pl.col("date").dt.weekday().alias("day_of_week"),
+        pl.col("date").dt.week().alias("week"),
+        pl.col("date").dt.month().alias("month"),
+        pl.col("date").dt.year().alias("year"),
+        pl.col("date").dt.day().alias("day_of_month"),
+        # Friday and Saturday, as in search_temporal_features
+        pl.col("date").dt.weekday().is_in([5, 6]).cast(pl.Int8).alias("is_weekend"),
+    )
+
+
+def build_holiday_calendar(
+    country_codes: Dict[int, str], years: range = CALENDAR_YEARS
+) -> pl.DataFrame:
+    """
+    One row per (day, country) with the public holiday flag and the number
+    of days to the next holiday (0 on a holiday). Holidays of the year after
+    the range are included, so late-December days have a next holiday too.
+
+    Parameters:
+    -----------
+    country_codes : Dict[int, str]
+        Country ID -> ISO 3166 code understood by the `holidays` package
+    years : range
+        Calendar years to cover
+
+    Returns:
+    --------
+    pl.DataFrame
+        date, country_id, is_holiday, days_to_next_holiday
+    """
+    dates = build_calendar(years).select("date")
+    frames = []
+    for country_id, code in country_codes.items():
+        country_holidays = holidays.country_holidays(
+            code, years=range(years[0], years[-1] + 2)
+        )
+        next_holiday = pl.DataFrame(
+            {"next_holiday": sorted(country_holidays.keys())},
+            schema={"next_holiday": pl.Date},
+        )
+        frames.append(
+            dates.join_asof(
+                next_holiday,
+                left_on="date",
+                right_on="next_holiday",
+                strategy="forward",
+            ).select(
+                "date",
+                pl.lit(country_id, dtype=pl.Int64).alias("country_id"),
+                (pl.col("date") == pl.col("next_holiday"))
+                .cast(pl.Int8)
+                .alias("is_holiday"),
+                (pl.col("next_holiday") - pl.col("date"))
+                .dt.total_days()
+                .cast(pl.Int16)
+                .alias("days_to_next_holiday"),
+            )
+        )
+    if not frames:
+        return pl.DataFrame(
+            schema={
+                "date": pl.Date,
+                "country_id": pl.Int64,
+                "is_holiday": pl.Int8,
+                "days_to_next_holiday": pl.Int16,
+            }
+        )
+    return pl.concat(frames)
+
+
+def _join_holidays(
+    lf: pl.LazyFrame,
+    holiday_calendar: pl.DataFrame,
+    date_col: str,
+    country_col: str,
+    is_holiday_col: str,
+    days_to_holiday_col: str,
+) -> pl.LazyFrame:
+    """
+    Left join the holiday columns on (date, country). Enum and Categorical
+    country columns (as written by the preprocessing) hold the IDs as
+    strings: casting an integer to them would read it as a category index,
+    so those are joined on the string value of the ID instead.
+    """
+    country_dtype = lf.collect_schema()[country_col]
+    if isinstance(country_dtype, (pl.Enum, pl.Categorical)) or country_dtype == pl.Utf8:
+        key = "__country_key"
+        lf = lf.with_columns(pl.col(country_col).cast(pl.Utf8).alias(key))
+        country_id = pl.col("country_id").cast(pl.Utf8)
+    else:
+        key = country_col
+        country_id = pl.col("country_id").cast(country_dtype)
+    right = holiday_calendar.lazy().select(
+        pl.col("date").alias(date_col),
+        country_id.alias(key),
+        pl.col("is_holiday").alias(is_holiday_col),
+        pl.col("days_to_next_holiday").alias(days_to_holiday_col),
+    )
+    lf = lf.join(right, on=[date_col, key], how="left", maintain_order="left")
+    return lf if key == country_col else lf.drop(key)
+
+
+def search_calendar_features(
+    lf: pl.LazyFrame,
+    country_codes: Optional[Dict[int, str]] = None,
+    years: range = CALENDAR_YEARS,
+) -> pl.LazyFrame:
+    """
+    Search-level calendar features: the date parts of the search and of the
+    expected check-in come from joins with the calendar on the date, and the
+    holiday columns of the search date from a join on (date, user country).
+    Only search-level columns are read, so this can run on the searches
+    dimension table.
+
+    Parameters:
+    -----------
+    lf : pl.LazyFrame
+        Needs search_timestamp, days_until_checkin and user_country_id
+    country_codes : Dict[int, str], optional
+        Country ID -> ISO code; loaded from COUNTRY_CODES_PATH if not given
+    years : range
+        Calendar years to cover
+
+    Returns:
+    --------
+    pl.LazyFrame
+        Input with search_* and checkin_* calendar columns added
+    """
+    country_codes = load_country_codes() if country_codes is None else country_codes
+    calendar = build_calendar(years).lazy()
+    hour = pl.col("search_timestamp").dt.hour()
+
+    lf = lf.with_columns(
+        hour.alias("search_hour"),
+        pl.col("search_timestamp").dt.date().alias("search_date"),
+        (pl.col("search_timestamp") + pl.duration(days=pl.col("days_until_checkin")))
+        .dt.date()
+        .alias("expected_checkin_date"),
+        pl.when(hour.is_between(0, 5))
+        .then(pl.lit("night"))
+        .when(hour.is_between(6, 11))
+        .then(pl.lit("morning"))
+        .when(hour.is_between(12, 17))
+        .then(pl.lit("afternoon"))
+        .otherwise(pl.lit("evening"))
+        .alias("search_time_of_day"),
+    )
+    lf = lf.join(
+        calendar.select(
+            pl.col("date").alias("search_date"),
+            pl.col("day_of_week").alias("search_day_of_week"),
+            pl.col("week").alias("search_week"),
+            pl.col("month").alias("search_month"),
+            pl.col("year").alias("search_year"),
+            pl.col("is_weekend").alias("is_weekend_search"),
+        ),
+        on="search_date",
+        how="left",
+        maintain_order="left",
+    ).join(
+        calendar.select(
+            pl.col("date").alias("expected_checkin_date"),
+            pl.col("day_of_week").alias("checkin_day_of_week"),
+            pl.col("day_of_month").alias("checkin_day_of_month"),
+            pl.col("month").alias("checkin_month"),
+            pl.col("is_weekend").alias("checkin_is_weekend"),
+        ),
+        on="expected_checkin_date",
+        how="left",
+        maintain_order="left",
+    )
+    return _join_holidays(
+        lf,
+        build_holiday_calendar(country_codes, years),
+        "search_date",
+        "user_country_id",
+        "search_timestamp_is_holiday",
+        "search_days_to_holiday",
+    )
+
+
+def checkin_holiday_features(
+    lf: pl.LazyFrame,
+    country_codes: Optional[Dict[int, str]] = None,
+    years: range = CALENDAR_YEARS,
+) -> pl.LazyFrame:
+    """
+    Holiday columns of the expected check-in in the hotel's country, from a
+    join on (date, hotel country). Needs expected_checkin_date (added by
+    `search_calendar_features`) and hotel_country_id.
+    """
+    country_codes = load_country_codes() if country_codes is None else country_codes
+    return _join_holidays(
+        lf,
+        build_holiday_calendar(country_codes, years),
+        "expected_checkin_date",
+        "hotel_country_id",
+        "expected_checkin_date_is_holiday",
+        "checkin_days_to_holiday",
+    )
+
+
+def calendar_time_features(
+    lf: pl.LazyFrame,
+    country_codes: Optional[Dict[int, str]] = None,
+    years: range = CALENDAR_YEARS,
+) -> pl.LazyFrame:
+    """
+    All calendar features of an impression table: `search_calendar_features`
+    followed by `checkin_holiday_features`. Holiday columns are null for
+    countries missing from the country code mapping.
+    """
+    country_codes = load_country_codes() if country_codes is None else country_codes
+    lf = search_calendar_features(lf, country_codes, years)
+    return checkin_holiday_features(lf, country_codes, years)
+
+
+__all__ = [
+    "build_calendar",
+    "build_holiday_calendar",
+    "search_calendar_features",
+    "checkin_holiday_features",
+    "calendar_time_features",
+]
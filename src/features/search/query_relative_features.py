@@ -0,0 +1,141 @@
+import polars as pl
+from typing import Callable, Dict, List, Optional
+
+# Column -> kinds of features relative to the other hotels of the same query.
+# Each kind adds one column named `{column}_query_{kind}`:
+# - rank: 1-based rank within the query, ascending, ties get the lowest rank
+# - median_ratio: value divided by the query median
+# - zscore: (value - query mean) / query std
+# - share: query mean of the column (the share of a 0/1 flag)
+QUERY_RELATIVE_FEATURES: Dict[str, List[str]] = {
+    "display_price": ["rank", "median_ratio", "zscore"],
+    "hotel_star_rating": ["zscore"],
+    "hotel_review_score": ["zscore"],
+    "location_score_primary": ["zscore"],
+    "location_score_secondary": ["zscore"],
+    "has_promotion": ["share"],
+}
+RELATIVE_KINDS = ("rank", "median_ratio", "zscore", "share")
+# A query std below this fraction of the query mean is rounding noise (the
+# windowed std of a constant column is ~1e-17, not 0): no z-score then
+_MIN_RELATIVE_STD = 1e-9
+
+
+def query_relative_feature_names(
+    spec: Optional[Dict[str, List[str]]] = None,
+) -> List[str]:
+    """Output columns of `query_relative_features` for a spec."""
+    spec = QUERY_RELATIVE_FEATURES if spec is None else spec
+    return [f"{col}_query_{kind}" for col, kinds in spec.items() for kind in kinds]
+
+
+def _query_stats(spec: Dict[str, List[str]]) -> Dict[str, pl.Expr]:
+    """The per-query aggregates behind the spec, by temporary column name."""
+    stats: Dict[str, pl.Expr] = {}
+    for col, kinds in spec.items():
+        unknown = set(kinds) - set(RELATIVE_KINDS)
+        if unknown:
+            raise ValueError(f"Unknown query-relative kinds for '{col}': {unknown}")
+        value = pl.col(col).cast(pl.Float64)
+        if "median_ratio" in kinds:
+            stats[f"__{col}_query_median"] = value.median()
+        if "zscore" in kinds:
+            stats[f"__{col}_query_mean"] = value.mean()
+            stats[f"__{col}_query_std"] = value.std()
+        if "share" in kinds:
+            stats[f"__{col}_query_share"] = value.mean()
+    return stats
+
+
+def _relative_exprs(
+    spec: Dict[str, List[str]],
+    stat: Callable[[str], pl.Expr],
+    query_col: str,
+) -> List[pl.Expr]:
+    """
+    Feature expressions of the spec; `stat` maps a temporary name of
+    `_query_stats` to the expression giving that aggregate on every row.
+    """
+    exprs = []
+    for col, kinds in spec.items():
+        value = pl.col(col).cast(pl.Float64)
+        for kind in kinds:
+            name = f"{col}_query_{kind}"
+            if kind == "rank":
+                exprs.append(
+                    pl.col(col).rank("min").over(query_col).cast(pl.Int16).alias(name)
+                )
+                continue
+            if kind == "median_ratio":
+                median = stat(f"__{col}_query_median")
+                expr = pl.when(median != 0).then(value / median)
+            elif kind == "zscore":
+                mean = stat(f"__{col}_query_mean")
+                std = stat(f"__{col}_query_std")
+                expr = pl.when(std > _MIN_RELATIVE_STD * mean.abs()).then(
+                    (value - mean) / std
+                )
+            else:
+                expr = stat(f"__{col}_query_share")
+            exprs.append(expr.cast(pl.Float32).alias(name))
+    return exprs
+
+
+def query_relative_features(
+    lf: pl.LazyFrame,
+    spec: Optional[Dict[str, List[str]]] = None,
+    query_col: str = "search_id",
+    query_sorted: bool = False,
+) -> pl.LazyFrame:
+    """
+    Features of every impression relative to the other hotels of its query
+    (rank, ratio to the median, z-score, share), all computed in one grouped
+    pass whatever the number of features:
+    - query_sorted=False: every aggregate comes from a single group_by on
+      the query, joined back once; only the ranks use a window
+    - query_sorted=True: the query column is flagged as sorted and the
+      aggregates are window expressions of one with_columns, so the queries
+      are cut into contiguous slices once, without hashing, and the slices
+      are shared by every aggregate; no join is needed
+
+    The sorted path is only correct if the rows of each query are contiguous
+    and the queries ascending, as in files read with `scan_query_sorted`.
+    Null values are left out of the aggregates; z-scores are null for
+    queries with a single value or no spread, ratios for a zero median.
+
+    Parameters:
+    -----------
+    lf : pl.LazyFrame
+        Impressions with the query column and the columns of the spec
+    spec : Dict[str, List[str]], optional
+        Column -> kinds; QUERY_RELATIVE_FEATURES if not given
+    query_col : str
+        Query identifier
+    query_sorted : bool
+        True if `lf` is sorted by the query column
+
+    Returns:
+    --------
+    pl.LazyFrame
+        Input with the `{column}_query_{kind}` columns added, rows in order
+    """
+    spec = QUERY_RELATIVE_FEATURES if spec is None else spec
+    stats = _query_stats(spec)
+
+    if query_sorted:
+        lf = lf.set_sorted(query_col).with_columns(
+            expr.over(query_col).alias(name) for name, expr in stats.items()
+        )
+    else:
+        query_stats = lf.group_by(query_col).agg(
+            expr.alias(name) for name, expr in stats.items()
+        )
+        lf = lf.join(query_stats, on=query_col, how="left", maintain_order="left")
+    return lf.with_columns(_relative_exprs(spec, pl.col, query_col)).drop(list(stats))
+
+
+__all__ = [
+    "QUERY_RELATIVE_FEATURES",
+    "query_relative_feature_names",
+    "query_relative_features",
+]
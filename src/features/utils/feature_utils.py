@@ -1,40 +1,80 @@
 import polars as pl
-from typing import List
+from typing import List, Optional, Union
 
+from utils.robust_stats import robust_stats
 
-def standardize_expr(col: str) -> pl.Expr:
-    return ((pl.col(col) - pl.col(col).mean()) / pl.col(col).std()).alias(
-        f"{col}_zscore"
-    )
 
+def standardize_expr(
+    col: str, mean: Optional[float] = None, std: Optional[float] = None
+) -> pl.Expr:
+    # Precomputed moments make the expression row-local (e.g. per partition)
+    mean = pl.col(col).mean() if mean is None else pl.lit(mean)
+    std = pl.col(col).std() if std is None else pl.lit(std)
+    return ((pl.col(col) - mean) / std).alias(f"{col}_zscore")
 
-def normalize_expr(col: str) -> pl.Expr:
-    return (
-        (pl.col(col) - pl.col(col).min()) / (pl.col(col).max() - pl.col(col).min())
-    ).alias(f"{col}_norm")
+
+def normalize_expr(
+    col: str, min_value: Optional[float] = None, max_value: Optional[float] = None
+) -> pl.Expr:
+    min_value = pl.col(col).min() if min_value is None else pl.lit(min_value)
+    max_value = pl.col(col).max() if max_value is None else pl.lit(max_value)
+    return ((pl.col(col) - min_value) / (max_value - min_value)).alias(f"{col}_norm")
 
 
 def mad_filter(
     lf: pl.LazyFrame,
-    input_column: str,
+    input_column: Union[str, List[str]],
     z_thresh: float = 3.5,
     output_suffix: str = "_mad_filtered",
+    sketch: bool = False,
 ) -> pl.LazyFrame:
-    output_suffix = output_suffix or input_column
+    """
+    Null out the outliers of one or several columns: values further than
+    z_thresh * MAD from the column's median.
+
+    The medians and MADs of all columns come from one scan (see
+    `robust_stats`) and the filters are added in one `with_columns`.
 
-    # Compute median and MAD (once) in eager mode
-    median = lf.select(pl.col(input_column).median().alias("median")).collect()[
-        "median"
-    ][
-        0
-    ]  # <- can we collect on a part of the lazy frame?
+    Parameters:
+    ----------
+    lf : pl.LazyFrame
+        The input LazyFrame.
+    input_column : str or List[str]
+        Column(s) to filter.
+    z_thresh : float
+        Threshold in MADs.
+    output_suffix : str
+        Suffix of the filtered columns; empty to filter in place.
+    sketch : bool
+        Approximate the statistics with a mergeable quantile sketch.
 
-    mad = lf.select(
-        (pl.col(input_column) - median).abs().median().alias("mad")
-    ).collect()["mad"][0]
-    threshold = z_thresh * mad
+    Returns:
+    -------
+    pl.LazyFrame
+        LazyFrame with the filtered columns added.
+    """
+    columns = [input_column] if isinstance(input_column, str) else list(input_column)
+    stats = robust_stats(lf, columns, sketch=sketch)
 
     return lf.with_columns(
+        mad_filter_expr(col, *stats[col], z_thresh, output_suffix) for col in columns
+    )
+
+
+def mad_filter_expr(
+    input_column: str,
+    median: Optional[float],
+    mad: Optional[float],
+    z_thresh: float = 3.5,
+    output_suffix: str = "_mad_filtered",
+) -> pl.Expr:
+    """
+    Null out the values further than z_thresh * mad from the median.
+    The median and MAD are given, so the expression is row-local; a column
+    without statistics (all null) is kept as is.
+    """
+    threshold = None if mad is None else z_thresh * mad
+    return (
         pl.when((pl.col(input_column) - median).abs() > threshold)
         .then(None)
         .otherwise(pl.col(input_column))
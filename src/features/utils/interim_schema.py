@@ -0,0 +1,91 @@
+import polars as pl
+from pathlib import Path
+from typing import Dict, Optional
+
+from utils.load_yaml import load_yaml
+
+_ROOT = Path(__file__).resolve().parents[3]
+# Raw -> interim names, used by the preprocessing (data/interim)
+INTERIM_RENAME_MAP_PATH = _ROOT / "configs" / "features" / "rename_map.yaml"
+# Raw -> feature names and the feature dtypes, used when reading the CSV
+FEATURE_RENAME_MAP_PATH = _ROOT / "src" / "configs" / "feature_rename_map.yaml"
+FEATURE_DTYPES_PATH = _ROOT / "src" / "configs" / "downcast_dtypes_map.yaml"
+
+
+def interim_to_feature_names(
+    interim_rename_map: Dict[str, str], feature_rename_map: Dict[str, str]
+) -> Dict[str, str]:
+    """
+    Interim column -> feature column, for the columns named differently.
+    Raw columns missing from the feature map keep their raw name.
+    """
+    names = {}
+    for raw, interim in interim_rename_map.items():
+        feature = feature_rename_map.get(raw, raw)
+        if feature != interim:
+            names[interim] = feature
+    return names
+
+
+def interim_to_features(
+    lf: pl.LazyFrame,
+    feature_rename_map: Optional[Dict[str, str]] = None,
+    feature_dtypes: Optional[Dict[str, pl.DataType]] = None,
+    interim_rename_map: Optional[Dict[str, str]] = None,
+) -> pl.LazyFrame:
+    """
+    Give interim data (written by `preprocess`) the names and dtypes the
+    feature code expects, as if it had been read from the raw CSV.
+
+    The preprocessing names some columns differently (e.g. is_clicked for
+    was_clicked) and encodes categorical IDs as Enums. Enum codes are
+    positions in a dictionary, not the IDs, so Enum and Categorical columns
+    are cast through their string value.
+
+    Parameters:
+    -----------
+    lf : pl.LazyFrame
+        Interim data, e.g. from `scan_dataset` or `scan_ipc_mirror`
+    feature_rename_map : Dict[str, str], optional
+        Raw -> feature names; loaded from FEATURE_RENAME_MAP_PATH if not given
+    feature_dtypes : Dict[str, pl.DataType], optional
+        Feature column -> dtype; loaded from FEATURE_DTYPES_PATH if not given
+    interim_rename_map : Dict[str, str], optional
+        Raw -> interim names; loaded from INTERIM_RENAME_MAP_PATH if not given
+
+    Returns:
+    --------
+    pl.LazyFrame
+        Same rows, feature names and dtypes
+    """
+    if feature_rename_map is None:
+        feature_rename_map = load_yaml(FEATURE_RENAME_MAP_PATH)
+    if feature_dtypes is None:
+        feature_dtypes = {
+            k: getattr(pl, v) for k, v in load_yaml(FEATURE_DTYPES_PATH).items()
+        }
+    if interim_rename_map is None:
+        interim_rename_map = load_yaml(INTERIM_RENAME_MAP_PATH)
+
+    # Only present columns: renaming absent ones (strict=False) breaks the
+    # projection pushdown of Polars 1.24 when the frame already has the
+    # feature names
+    present = lf.collect_schema().names()
+    names = interim_to_feature_names(interim_rename_map, feature_rename_map)
+    lf = lf.rename({old: new for old, new in names.items() if old in present})
+    schema = lf.collect_schema()
+    casts = []
+    for col, dtype in feature_dtypes.items():
+        if col not in schema:
+            continue
+        expr = pl.col(col)
+        if isinstance(schema[col], (pl.Enum, pl.Categorical)):
+            expr = expr.cast(pl.Utf8)
+        casts.append(expr.cast(dtype))
+    return lf.with_columns(casts)
+
+
+__all__ = [
+    "interim_to_feature_names",
+    "interim_to_features",
+]
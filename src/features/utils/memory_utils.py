@@ -1,138 +1,297 @@
+import hashlib
 import polars as pl
-import re
-from typing import List, Dict, Optional
+import pyarrow.parquet as pq
+import yaml
+from pathlib import Path
+from typing import Dict, List, Optional, Union
 
+from expedia_ranker.io.parquet_io import parquet_files
 
-def optimize_memory(lf: pl.LazyFrame, debug: bool = True) -> pl.LazyFrame:
+# Persisted next to the preprocessing schema (configs/features/schema.yaml)
+DTYPE_PLAN_PATH = (
+    Path(__file__).resolve().parents[3] / "configs" / "features" / "dtype_plan.yaml"
+)
+DEFAULT_SAMPLE_ROWS = 100_000
+# Strings with at most this many distinct values become an Enum
+MAX_ENUM_CATEGORIES = 256
+# Formats tried, in order, on string columns that may hold dates
+TEMPORAL_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%Y/%m/%d",
+    "%d/%m/%Y",
+]
+
+# Signed integer types, narrowest first, with their width in bits
+_INT_BITS = {"Int8": 8, "Int16": 16, "Int32": 32, "Int64": 64}
+
+DtypeSpec = Union[str, Dict[str, object]]
+
+
+def _narrowest_int(min_value: Optional[int], max_value: Optional[int]) -> str:
+    """Smallest signed integer type holding [min_value, max_value]."""
+    if min_value is None or max_value is None:
+        return "Int8"
+    for name, bits in _INT_BITS.items():
+        if -(2 ** (bits - 1)) <= min_value and max_value < 2 ** (bits - 1):
+            return name
+    return "Int64"
+
+
+def _parquet_ranges(path: Path) -> Dict[str, tuple]:
+    """Exact (min, max) of every integer column, from the footer statistics."""
+    ranges: Dict[str, tuple] = {}
+    for file in parquet_files(path):
+        metadata = pq.read_metadata(file)
+        for rg in range(metadata.num_row_groups):
+            row_group = metadata.row_group(rg)
+            for i in range(row_group.num_columns):
+                column = row_group.column(i)
+                stats = column.statistics
+                if stats is None or not stats.has_min_max:
+                    ranges[column.path_in_schema] = None
+                    continue
+                if not isinstance(stats.min, int) or isinstance(stats.min, bool):
+                    continue
+                name = column.path_in_schema
+                if name in ranges and ranges[name] is None:
+                    continue
+                lo, hi = ranges.get(name, (stats.min, stats.max))
+                ranges[name] = (min(lo, stats.min), max(hi, stats.max))
+    return {name: r for name, r in ranges.items() if r is not None}
+
+
+def _exact_ranges(lf: pl.LazyFrame, columns: List[str]) -> Dict[str, tuple]:
+    """Exact (min, max) of the given columns, in one aggregate scan."""
+    if not columns:
+        return {}
+    row = lf.select(
+        [pl.col(col).min().alias(f"{col}__min") for col in columns]
+        + [pl.col(col).max().alias(f"{col}__max") for col in columns]
+    ).collect()
+    return {col: (row[f"{col}__min"][0], row[f"{col}__max"][0]) for col in columns}
+
+
+def plan_fingerprint(lf: pl.LazyFrame, parquet_path: Optional[Path] = None) -> str:
     """
-    Optimize memory usage in a Polars LazyFrame with improved error handling:
-    - Attempt to convert string columns that look like dates to Date/Datetime
-    - Ensure numeric columns are properly typed for arithmetic operations
-    - Provide detailed debugging information when requested
+    Identify what a dtype plan was profiled on: the column names and dtypes
+    of `lf`, plus the names, sizes and modification times of the files of
+    `parquet_path` if given (no data is read).
+    """
+    digest = hashlib.sha256()
+    for col, dtype in lf.collect_schema().items():
+        digest.update(f"{col}:{dtype}\n".encode())
+    if parquet_path is not None:
+        for file in parquet_files(parquet_path):
+            stat = file.stat()
+            digest.update(f"{file.name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _temporal_spec(values: pl.Series) -> Optional[Dict[str, object]]:
+    """Date/Datetime spec if every sampled value parses with one format."""
+    values = values.drop_nulls()
+    if values.is_empty():
+        return None
+    for fmt in TEMPORAL_FORMATS:
+        parsed = values.str.to_datetime(fmt, strict=False)
+        if parsed.null_count() == 0:
+            is_date = (parsed.dt.truncate("1d") == parsed).all()
+            return {"dtype": "Date" if is_date else "Datetime", "format": fmt}
+    return None
+
+
+def _numeric_spec(values: pl.Series) -> Optional[str]:
+    """Narrowest numeric dtype if every sampled value is a number."""
+    values = values.drop_nulls()
+    if values.is_empty():
+        return None
+    as_int = values.cast(pl.Int64, strict=False)
+    if as_int.null_count() == 0:
+        return _narrowest_int(as_int.min(), as_int.max())
+    if values.cast(pl.Float64, strict=False).null_count() == 0:
+        return "Float32"
+    return None
+
+
+def profile_dtype_plan(
+    lf: pl.LazyFrame,
+    parquet_path: Optional[Path] = None,
+    sample_rows: int = DEFAULT_SAMPLE_ROWS,
+    max_enum_categories: int = MAX_ENUM_CATEGORIES,
+) -> Dict[str, DtypeSpec]:
+    """
+    Derive a concrete dtype for every column from one sample of the data:
+    - Integers: narrowest signed type holding the exact range, taken from
+      the footer statistics with `parquet_path`, else from one min/max
+      aggregate over the whole frame
+    - Floats: Float32
+    - Strings: Date/Datetime if every sampled value parses with one
+      format, a number if every value is one, an Enum if the column has
+      at most `max_enum_categories` distinct values (the categories are
+      read with one extra scan of those columns only), else unchanged
+    - Other types (Boolean, Date, Enum, ...) are kept
+
+    String columns are judged on the sample and can miss rare values: the
+    plan is applied with strict casts, so a value that does not fit fails
+    loudly. Re-profile then.
+
+    Parameters:
+    -----------
+    lf : pl.LazyFrame
+        The LazyFrame to profile
+    parquet_path : Path, optional
+        Parquet file or dataset behind `lf`, for exact integer ranges
+    sample_rows : int
+        Rows sampled from the head of the data
+    max_enum_categories : int
+        Cardinality limit for Enum columns
+
+    Returns:
+    --------
+    Dict[str, DtypeSpec]
+        Column -> dtype name, or {"dtype": ..., "format"/"categories": ...}
+    """
+    schema = lf.collect_schema()
+    sample = lf.head(sample_rows).collect()
+    ranges = _parquet_ranges(parquet_path) if parquet_path is not None else {}
+    ranges.update(
+        _exact_ranges(
+            lf,
+            [c for c, d in schema.items() if d.is_integer() and c not in ranges],
+        )
+    )
+
+    plan: Dict[str, DtypeSpec] = {}
+    enum_candidates: List[str] = []
+    for col, dtype in schema.items():
+        if dtype.is_integer():
+            plan[col] = _narrowest_int(*ranges[col])
+        elif dtype.is_float():
+            plan[col] = "Float32"
+        elif dtype == pl.String:
+            spec = _temporal_spec(sample[col]) or _numeric_spec(sample[col])
+            if spec is not None:
+                plan[col] = spec
+            elif sample[col].n_unique() <= max_enum_categories:
+                enum_candidates.append(col)
+
+    if enum_candidates:
+        uniques = pl.collect_all(
+            [lf.select(pl.col(col).unique().drop_nulls()) for col in enum_candidates]
+        )
+        for col, values in zip(enum_candidates, uniques):
+            if values.height <= max_enum_categories:
+                plan[col] = {
+                    "dtype": "Enum",
+                    "categories": sorted(values[col].to_list()),
+                }
+    return plan
+
+
+def _plan_expr(col: str, spec: DtypeSpec) -> pl.Expr:
+    """Expression applying one entry of a dtype plan."""
+    if isinstance(spec, str):
+        return pl.col(col).cast(getattr(pl, spec))
+    if spec["dtype"] == "Enum":
+        return pl.col(col).cast(pl.Enum(spec["categories"]))
+    if spec["dtype"] == "Date":
+        return pl.col(col).str.to_date(spec["format"])
+    if spec["dtype"] == "Datetime":
+        return pl.col(col).str.to_datetime(spec["format"])
+    raise ValueError(f"Unknown dtype spec for '{col}': {spec}")
+
+
+def apply_dtype_plan(lf: pl.LazyFrame, plan: Dict[str, DtypeSpec]) -> pl.LazyFrame:
+    """
+    Apply a dtype plan in one projection, without any runtime inference.
+    Columns missing from the frame are ignored; casts are strict.
+    """
+    present = lf.collect_schema().names()
+    return lf.with_columns(
+        _plan_expr(col, spec) for col, spec in plan.items() if col in present
+    )
+
+
+def save_dtype_plan(
+    plan: Dict[str, DtypeSpec],
+    path: Path = DTYPE_PLAN_PATH,
+    fingerprint: Optional[str] = None,
+) -> None:
+    """Persist a dtype plan as YAML, with the `plan_fingerprint` of its input."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        yaml.safe_dump(
+            {"fingerprint": fingerprint, "columns": plan}, f, sort_keys=False
+        )
+
+
+def load_dtype_plan(
+    path: Path = DTYPE_PLAN_PATH, fingerprint: Optional[str] = None
+) -> Optional[Dict[str, DtypeSpec]]:
+    """
+    Load a dtype plan saved by `save_dtype_plan`. With `fingerprint`, return
+    None unless the plan was profiled on an input with that fingerprint.
+    """
+    with open(path, "r") as f:
+        saved = yaml.safe_load(f) or {}
+    if fingerprint is not None and saved.get("fingerprint") != fingerprint:
+        return None
+    return saved.get("columns", {})
+
+
+def optimize_memory(
+    lf: pl.LazyFrame,
+    debug: bool = True,
+    plan_path: Path = DTYPE_PLAN_PATH,
+    parquet_path: Optional[Path] = None,
+    refresh: bool = False,
+) -> pl.LazyFrame:
+    """
+    Downcast a LazyFrame with a persisted dtype plan.
+
+    The first run (or `refresh=True`) profiles the data once with
+    `profile_dtype_plan` and saves the plan to `plan_path` with the
+    `plan_fingerprint` of the input; later runs on the same input only load
+    it, so the downcast costs no data access and the resulting schema is
+    the same on every run. A frame with other columns or dtypes, or another
+    `parquet_path` content, is profiled again and the plan replaced.
 
     Parameters:
     -----------
     lf : pl.LazyFrame
         The LazyFrame to optimize
-    debug : bool, default=False
-        Whether to print detailed debugging information
+    debug : bool, default=True
+        Whether to print the plan
+    plan_path : Path
+        YAML file of the dtype plan
+    parquet_path : Path, optional
+        Parquet source of `lf`, for exact integer ranges when profiling
+    refresh : bool
+        Re-profile even if a plan exists
 
     Returns:
     --------
     pl.LazyFrame
-        An optimized LazyFrame with proper type conversions
+        The LazyFrame with the planned dtypes
     """
-    print("🔧 Optimizing memory types (lazy)...")
+    fingerprint = plan_fingerprint(lf, parquet_path)
+    plan = None
+    if not refresh and plan_path.exists():
+        plan = load_dtype_plan(plan_path, fingerprint)
+        if plan is None:
+            print(f"⚠️ {plan_path} was profiled on another input, re-profiling")
+    if plan is None:
+        print("🔧 Profiling dtypes (one sample)...")
+        plan = profile_dtype_plan(lf, parquet_path=parquet_path)
+        save_dtype_plan(plan, plan_path, fingerprint)
+        print(f"Saved dtype plan to {plan_path}")
 
-    # Get schema information
-    schema = lf.schema
-    if debug:
-        print(f"Original schema: {schema}")
-
-    # Step 1: Handle date/time columns
-    date_pattern = re.compile(r"(date|time)", re.IGNORECASE)
-    date_cols = [
-        col for col in schema if date_pattern.search(col) and schema[col] == pl.String
-    ]
-
-    if date_cols:
-        if debug:
-            print(f"Attempting to convert date columns: {date_cols}")
-
-        date_exprs = []
-        for col in date_cols:
-            date_exprs.extend(
-                [
-                    pl.col(col).cast(pl.Date, strict=False).alias(f"{col}__try_date"),
-                    pl.col(col)
-                    .cast(pl.Datetime, strict=False)
-                    .alias(f"{col}__try_datetime"),
-                ]
-            )
-
-        lf = lf.with_columns(date_exprs)
-
-        for col in date_cols:
-            lf = lf.with_columns(
-                pl.when(pl.col(f"{col}__try_date").is_not_null())
-                .then(pl.col(f"{col}__try_date"))
-                .when(pl.col(f"{col}__try_datetime").is_not_null())
-                .then(pl.col(f"{col}__try_datetime"))
-                .otherwise(pl.col(col))
-                .alias(col)
-            )
-
-        # Drop temporary columns
-        temp_cols = [f"{col}__try_date" for col in date_cols] + [
-            f"{col}__try_datetime" for col in date_cols
-        ]
-        lf = lf.drop(temp_cols)
-
-    # Step 2: Ensure numeric columns are properly typed
-    # This is critical for arithmetic operations
-    numeric_pattern = re.compile(
-        r"(price|rating|score|diff|avg|mean|std|count|sum|min|max|rate)", re.IGNORECASE
-    )
-    potential_numeric_cols = [
-        col
-        for col in schema
-        if numeric_pattern.search(col) and schema[col] == pl.String
-    ]
-
-    if potential_numeric_cols:
-        if debug:
-            print(
-                f"Attempting to convert potential numeric columns: {potential_numeric_cols}"
-            )
-
-        numeric_exprs = []
-        for col in potential_numeric_cols:
-            # Try integer first, then float, keeping original if both fail
-            numeric_exprs.append(
-                pl.when(pl.col(col).cast(pl.Int64, strict=False).is_not_null())
-                .then(pl.col(col).cast(pl.Int64, strict=False))
-                .when(pl.col(col).cast(pl.Float64, strict=False).is_not_null())
-                .then(pl.col(col).cast(pl.Float64, strict=False))
-                .otherwise(pl.col(col))
-                .alias(col)
-            )
-
-        lf = lf.with_columns(numeric_exprs)
-
-    # Step 3: Downcast existing numeric columns
-    numeric_cols = [
-        col
-        for col, dtype in schema.items()
-        if isinstance(dtype, pl.DataType) and (dtype.is_integer() or dtype.is_float())
-    ]
-
-    if numeric_cols:
-        if debug:
-            print(f"Downcasting numeric columns: {numeric_cols}")
-        lf = lf.with_columns([pl.col(col).shrink_dtype() for col in numeric_cols])
-
-    # Step 4: Add a validation step to catch potential type issues
     if debug:
-        # Create a small sample to check for potential issues
-        try:
-            print("Validating with a small sample...")
-            sample_schema = lf.limit(5).collect_schema()
-            print(f"Optimized schema: {sample_schema}")
-
-            # Check for columns that might cause arithmetic issues
-            arithmetic_cols = [
-                col for col in sample_schema if numeric_pattern.search(col)
-            ]
-            for col in arithmetic_cols:
-                if sample_schema[col] == pl.String:
-                    print(
-                        f"⚠️ Warning: Column '{col}' is still a string but might be used in arithmetic"
-                    )
-        except Exception as e:
-            print(f"❌ Validation error: {e}")
-            print(
-                "Consider adding explicit casts for columns used in arithmetic operations"
-            )
+        for col, spec in plan.items():
+            print(f"  {col}: {spec if isinstance(spec, str) else spec['dtype']}")
 
     print("✅ Type optimization complete.")
-    return lf
+    return apply_dtype_plan(lf, plan)
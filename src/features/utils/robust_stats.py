@@ -0,0 +1,215 @@
+import math
+import polars as pl
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from expedia_ranker.data_pipeline.preprocessing.streaming_engine import (
+    new_streaming_engine,
+)
+
+# Relative error of the sketch quantiles (1%)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# Values closer to zero than this share the sketch's zero bucket
+_MIN_SKETCH_VALUE = 1e-9
+
+
+def exact_robust_stats(
+    lf: pl.LazyFrame, columns: List[str]
+) -> Dict[str, Tuple[float, float]]:
+    """
+    Exact median and median absolute deviation (MAD) of several columns
+    with a single scan: only the columns are materialized, then both
+    medians are taken in memory.
+
+    Parameters:
+    -----------
+    lf : pl.LazyFrame
+        Input LazyFrame
+    columns : List[str]
+        Numeric columns
+
+    Returns:
+    --------
+    Dict[str, Tuple[float, float]]
+        Column -> (median, MAD); None for a column without values
+    """
+    df = lf.select(columns).collect()
+    medians = df.select(pl.col(col).median() for col in columns).row(0)
+    mads = df.select(
+        (pl.col(col) - median).abs().median() if median is not None else pl.lit(None)
+        for col, median in zip(columns, medians)
+    ).row(0)
+    return {col: (median, mad) for col, median, mad in zip(columns, medians, mads)}
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative accuracy (DDSketch style).
+
+    Values are counted in logarithmic buckets: bucket i holds magnitudes
+    in (m * gamma^(i-2), m * gamma^(i-1)] with gamma = (1 + a) / (1 - a),
+    the sign of a value is the sign of its bucket and bucket 0 holds the
+    values below m, so every quantile is returned within a relative
+    error a. A sketch is a small table of (column, bucket, count) built by
+    one group_by, which runs under the streaming engine. Sketches of
+    partitions or batches are merged by adding their counts, in any order.
+
+    The MAD is derived from the buckets around the median, so its error
+    is relative to the magnitude of the values, not to the MAD itself: a
+    MAD no wider than the median's bucket (`bucket_width`), as for a large
+    offset with a small spread, is not resolved at all.
+    """
+
+    def __init__(
+        self,
+        counts: pl.DataFrame,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+    ):
+        self.counts = counts
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+
+    @classmethod
+    def from_frame(
+        cls,
+        lf: pl.LazyFrame,
+        columns: List[str],
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+    ) -> "QuantileSketch":
+        """
+        Sketch several columns of a LazyFrame in one scan. Nulls and NaNs
+        are left out.
+        """
+        log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        value = pl.col("value").cast(pl.Float64)
+        bucket = (
+            pl.when(value.abs() < _MIN_SKETCH_VALUE)
+            .then(0)
+            .otherwise(
+                value.sign()
+                * (((value.abs() / _MIN_SKETCH_VALUE).log() / log_gamma).ceil() + 1)
+            )
+            .cast(pl.Int32)
+            .alias("bucket")
+        )
+        with new_streaming_engine():
+            counts = (
+                lf.select(pl.col(columns).cast(pl.Float64))
+                .unpivot(variable_name="column", value_name="value")
+                .filter(pl.col("value").is_not_null() & pl.col("value").is_not_nan())
+                .group_by("column", bucket)
+                .agg(pl.len().cast(pl.UInt64).alias("count"))
+                .collect()
+            )
+        return cls(counts, relative_accuracy)
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Return the sketch of both inputs together."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches of different accuracy")
+        counts = (
+            pl.concat([self.counts, other.counts])
+            .group_by("column", "bucket")
+            .agg(pl.col("count").sum())
+        )
+        return QuantileSketch(counts, self.relative_accuracy)
+
+    def _values(self, column: str) -> pl.DataFrame:
+        """Representative value and count of every bucket, sorted by value."""
+        k = pl.col("bucket").abs() - 1
+        return (
+            self.counts.filter(pl.col("column") == column)
+            .select(
+                (
+                    pl.col("bucket").sign()
+                    * 2
+                    * _MIN_SKETCH_VALUE
+                    * pl.lit(self.gamma).pow(k)
+                    / (1 + self.gamma)
+                ).alias("value"),
+                "count",
+            )
+            .sort("value")
+        )
+
+    @staticmethod
+    def _weighted_quantile(values: pl.DataFrame, q: float) -> Optional[float]:
+        total = values["count"].sum()
+        if not total:
+            return None
+        rank = q * (total - 1)
+        cumulative = values["count"].cum_sum()
+        return values["value"][int((cumulative <= rank).sum())]
+
+    def bucket_width(self, value: float) -> float:
+        """Width of the bucket holding a value (as returned by the sketch)."""
+        if abs(value) < _MIN_SKETCH_VALUE:
+            return _MIN_SKETCH_VALUE
+        return abs(value) * (self.gamma**2 - 1) / (2 * self.gamma)
+
+    def quantile(self, column: str, q: float) -> Optional[float]:
+        """Quantile q of a column, within the relative accuracy."""
+        return self._weighted_quantile(self._values(column), q)
+
+    def median_mad(self, column: str) -> Tuple[Optional[float], Optional[float]]:
+        """Approximate median and MAD of a column."""
+        values = self._values(column)
+        median = self._weighted_quantile(values, 0.5)
+        if median is None:
+            return None, None
+        deviations = values.select(
+            (pl.col("value") - median).abs().alias("value"), "count"
+        ).sort("value")
+        return median, self._weighted_quantile(deviations, 0.5)
+
+
+def robust_stats(
+    lf: pl.LazyFrame,
+    columns: List[str],
+    sketch: bool = False,
+    relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+) -> Dict[str, Tuple[float, float]]:
+    """
+    Median and MAD of every column, with a single scan of the data.
+
+    Parameters:
+    -----------
+    lf : pl.LazyFrame
+        Input LazyFrame
+    columns : List[str]
+        Numeric columns
+    sketch : bool
+        Approximate with a `QuantileSketch` (bounded memory, streaming)
+        instead of materializing the columns. Columns whose sketch MAD is
+        not wider than the bucket of their median (a spread too small for
+        the sketch to resolve) are computed exactly, with a second scan of
+        those columns only
+    relative_accuracy : float
+        Relative error of the sketch
+
+    Returns:
+    --------
+    Dict[str, Tuple[float, float]]
+        Column -> (median, MAD)
+    """
+    if not sketch:
+        return exact_robust_stats(lf, columns)
+    sk = QuantileSketch.from_frame(lf, columns, relative_accuracy)
+    stats = {col: sk.median_mad(col) for col in columns}
+    unresolved = [
+        col
+        for col, (median, mad) in stats.items()
+        if median is not None and mad <= sk.bucket_width(median)
+    ]
+    if unresolved:
+        print(f"MAD below the sketch resolution, computing exactly: {unresolved}")
+        stats.update(exact_robust_stats(lf, unresolved))
+    return stats
+
+
+def merge_sketches(sketches: Iterable[QuantileSketch]) -> QuantileSketch:
+    """Merge the sketches of several partitions or batches."""
+    sketches = iter(sketches)
+    merged = next(sketches)
+    for sk in sketches:
+        merged = merged.merge(sk)
+    return merged
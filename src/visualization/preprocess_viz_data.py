@@ -3,13 +3,21 @@ import numpy as np
 from pathlib import Path
 import logging
 
+from expedia_ranker.io.ipc_io import scan_ipc_mirror
+from expedia_ranker.io.parquet_io import scan_dataset
+
 def setup_logger():
     logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
     return logging.getLogger(__name__)
 
-def load_data(data_path: Path) -> pl.LazyFrame:
+def load_data(data_path: Path, ipc_mirror: bool = False) -> pl.LazyFrame:
     logger.info("Loading dataset...")
-    df = pl.scan_parquet(str(data_path))
+    if ipc_mirror:
+        # Memory-mapped Arrow mirror, rewritten only when the Parquet changes
+        df = scan_ipc_mirror(data_path)
+    else:
+        # Partition columns and virtual placeholders become regular columns
+        df = scan_dataset(data_path)
     df = df.with_columns(
     pl.when(pl.col("target") == 0).then(pl.lit("Not Clicked"))
             .when(pl.col("target") == 1).then(pl.lit("Clicked"))